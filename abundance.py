@@ -0,0 +1,160 @@
+'''
+Abundance filtering of k-mers ahead of graph construction.
+
+Sequencing errors turn up as k-mers seen only once or twice, and on noisy
+reads they outnumber the real (solid) k-mers. filter_kmers removes them in
+two streaming passes over the input:
+
+  pass 1: count every k-mer in a count-min sketch, a depth x width table of
+          saturating uint8 counters with a fixed memory budget. A k-mer's
+          estimate is the minimum of its counters and is never below its
+          true count;
+  pass 2: count exactly, in a KmerTable, only the k-mers whose estimate
+          reaches min_abundance, and keep those whose exact count does.
+
+Only the survivors of pass 1 ever get an entry of their own, so the memory
+used is the sketch plus the (far fewer) solid k-mers. The input has to be
+read twice: pass a list or array, or a callable returning a fresh iterator
+(e.g. lambda: read_kmers(path, k, packed=True)); a one-shot iterator is
+rejected with a TypeError unless min_abundance is 1, which needs one pass.
+
+K-mers are strings or packed codes, k <= 32.
+'''
+
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+import numpy as np
+
+from kmer_array import encode_kmer_array, MAX_K
+from kmer_codec import decode, revcomp_codes
+from kmer_table import KmerTable, mix64, mix64_array
+
+_MAX_COUNT = np.iinfo(np.uint8).max
+
+class CountMinSketch:
+    def __init__(self, memory_bytes: int = 1 << 26, depth: int = 4):
+        # width is a power of two so a slot is a mask away from the hash
+        width = 1
+        while width * 2 * depth <= memory_bytes:
+            width <<= 1
+        self.depth = depth
+        self.width = width
+        self.table = np.zeros((depth, width), dtype=np.uint8)
+        self._seeds = [np.uint64(mix64(row + 1)) for row in range(depth)]
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+    def _slots(self, codes, row):
+        return mix64_array(codes ^ self._seeds[row]) & np.uint64(self.width - 1)
+
+    def add(self, codes: np.ndarray) -> None:
+        codes = np.asarray(codes, dtype=np.uint64)
+        for row in range(self.depth):
+            slots, counts = np.unique(self._slots(codes, row), return_counts=True)
+            counters = self.table[row]
+            counters[slots] = np.minimum(counters[slots] + counts, _MAX_COUNT)
+
+    def estimate(self, codes: np.ndarray) -> np.ndarray:
+        codes = np.asarray(codes, dtype=np.uint64)
+        est = np.full(len(codes), _MAX_COUNT, dtype=np.uint8)
+        for row in range(self.depth):
+            np.minimum(est, self.table[row][self._slots(codes, row)], out=est)
+        return est
+
+def _batches(source, batch_size, canonical):
+    # (k, codes) for consecutive batches of the input
+    it = source() if callable(source) else iter(source)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        if isinstance(batch[0], str):
+            codes = encode_kmer_array(batch)
+            k = len(batch[0])
+        else:
+            codes = np.array(batch, dtype=np.uint64)
+            k = canonical
+        if canonical:
+            np.minimum(codes, revcomp_codes(codes, k), out=codes)
+        yield k, codes
+
+def count_solid_kmers(source: Union[Iterable, Callable[[], Iterator]],
+                      min_abundance: int = 2, memory_bytes: int = 1 << 26,
+                      depth: int = 4, batch_size: int = 1 << 16,
+                      canonical=False):
+    # (codes, counts) of the k-mers seen at least min_abundance times, in
+    # order of first occurrence. canonical counts a k-mer and its reverse
+    # complement together; for packed codes pass k as canonical.
+    if not 1 <= min_abundance <= _MAX_COUNT:
+        raise ValueError(f"min_abundance must be between 1 and {_MAX_COUNT}")
+    if min_abundance > 1:
+        _check_reiterable(source)
+    sketch = CountMinSketch(memory_bytes, depth)
+    if min_abundance > 1:
+        for _, codes in _batches(source, batch_size, canonical):
+            sketch.add(codes)
+    table = KmerTable()
+    # code and exact count by table id; the arrays grow geometrically and
+    # a batch only touches the ids it contains
+    solid = np.zeros(1024, dtype=np.uint64)
+    counts = np.zeros(1024, dtype=np.int64)
+    for _, codes in _batches(source, batch_size, canonical):
+        if min_abundance > 1:
+            codes = codes[sketch.estimate(codes) >= min_abundance]
+        first_new = table.next_id
+        ids = table.insert_many(codes)
+        if table.next_id > len(solid):
+            size = len(solid)
+            while size < table.next_id:
+                size *= 2
+            solid = np.resize(solid, size)
+            counts = np.resize(counts, size)
+            counts[first_new:] = 0
+        new = ids >= first_new
+        solid[ids[new]] = codes[new]
+        batch_ids, batch_counts = np.unique(ids, return_counts=True)
+        counts[batch_ids] += batch_counts
+    keep = counts[:table.next_id] >= min_abundance
+    return solid[:table.next_id][keep], counts[:table.next_id][keep]
+
+def _check_reiterable(source):
+    # the filter reads its input twice, which a one-shot iterator cannot do
+    if not callable(source) and iter(source) is source:
+        raise TypeError("abundance filtering reads the k-mers twice: pass a list or "
+                        "a callable returning a fresh iterator, e.g. "
+                        "lambda: read_kmers(path, k), instead of an iterator")
+
+def filter_kmers(source: Union[Iterable, Callable[[], Iterator]],
+                 min_abundance: int = 2, memory_bytes: int = 1 << 26,
+                 depth: int = 4, batch_size: int = 1 << 16,
+                 k: Optional[int] = None, canonical: bool = False) -> Iterator:
+    # each solid k-mer once, as a string for string input and as a code for
+    # packed input (k is needed for packed input with canonical=True)
+    if min_abundance > 1:
+        _check_reiterable(source)
+    if not callable(source) and iter(source) is source:
+        # min_abundance 1 needs a single pass: put the peeked k-mer back
+        first = next(source, None)
+        source = chain([first], source)
+    else:
+        # peek through an iterator of its own, the passes below start afresh
+        first = next(iter(source() if callable(source) else source), None)
+    if first is None:
+        return iter(())
+    strings = isinstance(first, str)
+    if strings:
+        k = len(first)
+    if k is not None and k > MAX_K:
+        raise ValueError(f"abundance filtering needs k <= {MAX_K}, got {k}")
+    if canonical:
+        if k is None:
+            raise ValueError("k is required for canonical packed k-mers")
+        canonical = k
+    solid, _ = count_solid_kmers(source, min_abundance, memory_bytes, depth,
+                                 batch_size, canonical)
+    if strings:
+        return (decode(code, k) for code in solid.tolist())
+    return iter(solid.tolist())
@@ -0,0 +1,305 @@
+'''
+Regression benchmarks for the k-assembler.
+
+graph build scaling: times the hash-based de Bruijn graph builders on growing
+numbers of k-mers and fits the exponent of time ~ n^e on a log-log scale.
+A linear builder gives e close to 1; the old suffix_composition pass and the
+list concatenation in the non-deque builder pushed it towards 2.
+
+traversal speedup: times eulPath on the dict-of-deques graph against the CSR
+Hierholzer engine in euler.py on the test_1 style random sequence with k=20.
+
+suite: runs every method of test_seq_assembly over a grid of sequence lengths
+and k values. Each repeat runs the whole pipeline and times its stages
+(build, balance, traverse, spell) separately with perf_counter_ns, after
+some untimed warmup runs and with the cyclic gc paused. The sequence of every
+grid cell comes from a fixed seed. Peak memory is measured with tracemalloc
+in one extra run, since tracing slows everything down (it only sees the
+parent process, so the parallel builder's workers are not counted). Results
+are written as JSON; compare flags every stage, total or peak memory that got
+slower or bigger than a threshold between two result files.
+
+Run with:
+  python benchmark.py                     # the two regression checks
+  python benchmark.py suite -o new.json [--lengths 1000 100000 --ks 21 ...]
+  python benchmark.py compare old.json new.json [--threshold 0.1]
+'''
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from pairwise import random_DNA_sequence, get_kmers, compare_composition
+from pairwise import debrujin_graph_from_kmers, debrujin_graph_from_kmers_nondeque
+from pairwise import balanceCount, eulPath, genomePath, create_deBruijn_graph_by_string_comp
+from kmer_array import encode_kmer_array, debrujin_graph_from_kmer_array, pack_kmers
+from euler import eulerian_path
+from parallel_build import debrujin_graph_parallel
+
+GRAPH_BUILDERS = {
+    "k-mer hashing": debrujin_graph_from_kmers,
+    "k-mer hashing without deque": debrujin_graph_from_kmers_nondeque,
+}
+
+def best_time(fn, arg, repeats=3):
+    # best of several runs with the cyclic gc paused, the least noisy
+    # estimate on a shared machine
+    best = math.inf
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            begin = time.perf_counter()
+            fn(arg)
+            best = min(best, time.perf_counter() - begin)
+    finally:
+        gc.enable()
+    return best
+
+def fit_exponent(sizes, times):
+    # least squares slope of log(time) against log(size)
+    xs = [math.log(n) for n in sizes]
+    ys = [math.log(t) for t in times]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    num = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys))
+    den = sum((x - x_mean) ** 2 for x in xs)
+    return num / den
+
+def graph_build_scaling(method, sizes=(10000, 40000, 160000), k=20, repeats=3):
+    build = GRAPH_BUILDERS[method]
+    times = []
+    for n in sizes:
+        seq = random_DNA_sequence(n + k - 1, n + k - 1)
+        kmers = get_kmers(seq, k)
+        times.append(best_time(build, kmers, repeats))
+    return times, fit_exponent(sizes, times)
+
+def check_linear_graph_build(max_exponent=1.3):
+    passed = True
+    for method in GRAPH_BUILDERS:
+        times, exponent = graph_build_scaling(method)
+        ok = exponent <= max_exponent
+        passed = passed and ok
+        status = "PASSED" if ok else "FAILED"
+        timings = ", ".join(f"{t:.4f}s" for t in times)
+        print(f"{status} {method}: build time ~ n^{exponent:.2f} ({timings})")
+    return passed
+
+def traversal_speedup(length=20000, k=20, repeats=3):
+    seq = random_DNA_sequence(length, length)
+    kmers = get_kmers(seq, k)
+    csr = debrujin_graph_from_kmer_array(encode_kmer_array(kmers), k)
+    old = math.inf
+    for _ in range(repeats):
+        # eulPath drains the deques, so it needs a fresh graph every run
+        g = debrujin_graph_from_kmers(kmers)
+        balanced_count = balanceCount(g)
+        begin = time.perf_counter()
+        eulPath(g, balanced_count)
+        old = min(old, time.perf_counter() - begin)
+    new = best_time(eulerian_path, csr, repeats)
+    return old, new
+
+def check_traversal_speedup(min_speedup=5.0):
+    old, new = traversal_speedup()
+    ok = old / new >= min_speedup
+    status = "PASSED" if ok else "FAILED"
+    print(f"{status} Eulerian traversal: eulPath {old:.4f}s, CSR engine {new:.4f}s ({old / new:.1f}x)")
+    return ok
+
+SUITE_LENGTHS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+SUITE_KS = (15, 21, 31)
+
+# method -> (prepare, stages): prepare(seq, k) makes the untimed input, and
+# stages(k) is the list of (name, fn) run in order, each fn taking the
+# previous stage's result
+def _dict_stages(build):
+    return lambda k: [
+        ("build", build),
+        ("balance", lambda g: (g, balanceCount(g))),
+        ("traverse", lambda gb: eulPath(*gb)),
+        ("spell", genomePath)]
+
+def _packed_stages(k):
+    return [
+        ("build", lambda codes: debrujin_graph_from_kmers(codes, k)),
+        ("balance", lambda g: (g, balanceCount(g))),
+        ("traverse", lambda gb: eulPath(*gb)),
+        ("spell", lambda path: genomePath(path, k=k))]
+
+def _csr_stages(build):
+    return lambda k: [
+        ("build", lambda codes: build(codes, k)),
+        ("balance", lambda csr: (csr, csr.validate())),
+        ("traverse", lambda cv: (cv[0], eulerian_path(cv[0]))),
+        ("spell", lambda cp: cp[0].spell(cp[1]))]
+
+SUITE_METHODS = {
+    "k-mer pairwise comparison": (
+        get_kmers, lambda k: [("build", create_deBruijn_graph_by_string_comp)]),
+    "k-mer hashing": (get_kmers, _dict_stages(debrujin_graph_from_kmers)),
+    "k-mer hashing without deque": (get_kmers, _dict_stages(debrujin_graph_from_kmers_nondeque)),
+    "packed k-mer hashing": (
+        lambda seq, k: pack_kmers(get_kmers(seq, k))[0], _packed_stages),
+    "k-mer array": (
+        lambda seq, k: encode_kmer_array(get_kmers(seq, k)),
+        _csr_stages(debrujin_graph_from_kmer_array)),
+    "parallel k-mer array": (
+        lambda seq, k: encode_kmer_array(get_kmers(seq, k)),
+        _csr_stages(debrujin_graph_parallel)),
+}
+
+def run_pipeline(stages, data):
+    # (stage -> elapsed ns, final result) of one run
+    elapsed = {}
+    for name, fn in stages:
+        begin = time.perf_counter_ns()
+        data = fn(data)
+        elapsed[name] = time.perf_counter_ns() - begin
+    return elapsed, data
+
+def benchmark_cell(method, length, k, seed=0, repeats=5, warmups=1):
+    prepare, make_stages = SUITE_METHODS[method]
+    random.seed(seed)
+    seq = random_DNA_sequence(length, length, seed)
+    data = prepare(seq, k)
+    stages = make_stages(k)
+    for _ in range(warmups):
+        run_pipeline(stages, data)
+    runs = {name: [] for name, _ in stages}
+    totals = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            elapsed, result = run_pipeline(stages, data)
+            for name, ns in elapsed.items():
+                runs[name].append(ns)
+            totals.append(sum(elapsed.values()))
+    finally:
+        gc.enable()
+    tracemalloc.start()
+    try:
+        run_pipeline(stages, data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    correct = None
+    if isinstance(result, str):
+        correct = result == seq or compare_composition(result, seq, k)
+    return {
+        "method": method, "length": length, "k": k, "seed": seed,
+        "stages": {name: {"min_ns": min(ns), "median_ns": int(statistics.median(ns)),
+                          "runs_ns": ns}
+                   for name, ns in runs.items()},
+        "total": {"min_ns": min(totals), "median_ns": int(statistics.median(totals))},
+        "peak_bytes": peak,
+        "correct": correct,
+    }
+
+def run_suite(methods=None, lengths=SUITE_LENGTHS, ks=SUITE_KS, seed=0,
+              repeats=5, warmups=1, log=print):
+    results = []
+    for method in methods or SUITE_METHODS:
+        for length in lengths:
+            for k in ks:
+                if k > length:
+                    continue
+                cell = benchmark_cell(method, length, k, seed, repeats, warmups)
+                results.append(cell)
+                log(f"{method:28s} {length:>10d} k={k:<3d} "
+                    f"{cell['total']['median_ns'] / 1e6:12.2f} ms "
+                    f"{cell['peak_bytes'] / 2**20:10.1f} MiB")
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed, "repeats": repeats, "warmups": warmups,
+        },
+        "results": results,
+    }
+
+def compare_results(old, new, threshold=0.1, min_delta_ns=1_000_000):
+    # list of (cell, metric, old, new) that got worse by more than threshold
+    # (relative) and min_delta_ns (absolute, for times)
+    def key(cell):
+        return (cell["method"], cell["length"], cell["k"])
+    before = {key(cell): cell for cell in old["results"]}
+    regressions = []
+    for cell in new["results"]:
+        prev = before.get(key(cell))
+        if prev is None:
+            continue
+        metrics = [("total", prev["total"]["median_ns"], cell["total"]["median_ns"])]
+        for name, stage in cell["stages"].items():
+            if name in prev["stages"]:
+                metrics.append((name, prev["stages"][name]["median_ns"], stage["median_ns"]))
+        for name, a, b in metrics:
+            if b > a * (1 + threshold) and b - a > min_delta_ns:
+                regressions.append((key(cell), name, a, b))
+        a, b = prev["peak_bytes"], cell["peak_bytes"]
+        if b > a * (1 + threshold):
+            regressions.append((key(cell), "peak_bytes", a, b))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="k-assembler benchmarks")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("check", help="graph build scaling and traversal speedup checks")
+    suite = sub.add_parser("suite", help="time every method over a grid")
+    suite.add_argument("-o", "--output", help="JSON result file (default: stdout)")
+    suite.add_argument("--methods", nargs="+", choices=list(SUITE_METHODS), metavar="METHOD")
+    suite.add_argument("--lengths", nargs="+", type=int, default=list(SUITE_LENGTHS))
+    suite.add_argument("--ks", nargs="+", type=int, default=list(SUITE_KS))
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--repeats", type=int, default=5)
+    suite.add_argument("--warmups", type=int, default=1)
+    compare = sub.add_parser("compare", help="flag regressions between two result files")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.1)
+    compare.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "suite":
+        log = print if args.output else (lambda line: print(line, file=sys.stderr))
+        report = run_suite(args.methods, args.lengths, args.ks, args.seed,
+                           args.repeats, args.warmups, log)
+        if args.output:
+            with open(args.output, "w") as fh:
+                json.dump(report, fh, indent=1)
+        else:
+            json.dump(report, sys.stdout, indent=1)
+        return 0
+    if args.command == "compare":
+        with open(args.old) as fh:
+            old = json.load(fh)
+        with open(args.new) as fh:
+            new = json.load(fh)
+        regressions = compare_results(old, new, args.threshold, args.min_delta_ms * 1e6)
+        for (method, length, k), metric, a, b in regressions:
+            print(f"REGRESSION {method} length={length} k={k} {metric}: {a} -> {b} "
+                  f"({(b / a - 1) * 100 if a else math.inf:+.1f}%)")
+        if not regressions:
+            print("No regressions")
+        return 1 if regressions else 0
+    passed = check_linear_graph_build()
+    passed = check_traversal_speedup() and passed
+    return 0 if passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+'''
+Reverse-complement aware (bidirected) de Bruijn graph over canonical k-mers.
+
+Reads from a double-stranded genome contain every k-mer in either
+orientation. Storing each k-mer under its canonical code, min(kmer,
+revcomp(kmer)), keeps one entry for both strands instead of two half-graphs.
+
+Nothing but the canonical k-mer counts is stored. An oriented (k-1)-mer node
+x has an edge for every base b whose k-mer x+b, read in either orientation,
+is present; following it consumes one copy of that canonical k-mer, so the
+walk can switch strands wherever the reads overlap only as reverse
+complements. eulerian_walk runs Hierholzer over these oriented nodes.
+
+The balance is taken over both strands: every k-mer counts once as itself
+and once as its reverse complement, so a palindromic k-mer (even k only)
+counts twice as itself. A genome read from s to t then leaves s and rc(t)
+with a positive balance, 2 when s = rc(t), and the walk may start at either.
+A palindromic (k-1)-mer (odd k only) is its own reverse complement, so its
+balance always cancels out; it is an end of the genome exactly when an odd
+number of k-mers touch it, counting both orientations.
+
+From such a start the greedy walk cannot fail on a connected input: every
+other node is left through one side and entered through the other, and the
+sides are balanced, so a walk only ever gets stuck at the end of the genome,
+and a spliced sub-circuit only where it began, on the same strand.
+'''
+
+from collections import defaultdict
+from typing import Iterable, List, Optional
+
+from kmer_codec import canonical_code, encode, kmer_mask, revcomp_code, spell_path
+
+class CanonicalGraph:
+    def __init__(self, k: int):
+        self.k = k
+        # canonical k-mer code -> number of times it was added
+        self.counts = defaultdict(int)
+        self.num_edges = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def add_kmer(self, code: int) -> None:
+        self.counts[canonical_code(code, self.k)] += 1
+        self.num_edges += 1
+
+    def add_kmers(self, codes: Iterable[int]) -> None:
+        k = self.k
+        counts = self.counts
+        n = 0
+        for code in codes:
+            counts[canonical_code(code, k)] += 1
+            n += 1
+        self.num_edges += n
+
+    def oriented_balance(self) -> dict:
+        # out-degree minus in-degree of the oriented (k-1)-mers, counting
+        # every k-mer in both orientations; unbalanced nodes only
+        k = self.k
+        mask = kmer_mask(k - 1)
+        balance = defaultdict(int)
+        for code, n in self.counts.items():
+            rc = revcomp_code(code, k)
+            for c in ((code, code) if rc == code else (code, rc)):
+                balance[c >> 2] += n
+                balance[c & mask] -= n
+        return {node: b for node, b in balance.items() if b}
+
+    def odd_palindromes(self) -> List[int]:
+        # palindromic (k-1)-mers touched by an odd number of k-mer ends
+        k = self.k
+        degree = defaultdict(int)
+        for code, n in self.counts.items():
+            rc = revcomp_code(code, k)
+            for c in ((code, code) if rc == code else (code, rc)):
+                node = c >> 2
+                if revcomp_code(node, k - 1) == node:
+                    degree[node] += n
+        return [node for node, d in degree.items() if d % 2]
+
+    def start_node(self) -> Optional[int]:
+        # an oriented node with more outgoing than incoming edges, else a
+        # palindromic end, or any node for a graph of cycles
+        sources = [node for node, b in self.oriented_balance().items() if b > 0]
+        if not sources and self.k % 2 == 1:
+            sources = self.odd_palindromes()
+        if sources:
+            return min(sources)
+        return next((code >> 2 for code in self.counts), None)
+
+    def eulerian_walk(self) -> List[int]:
+        # oriented (k-1)-mer codes of a walk using every k-mer copy once in
+        # one of its orientations; empty if no such walk was found
+        start = self.start_node()
+        if start is None:
+            return []
+        k = self.k
+        node_mask = kmer_mask(k - 1)
+        remaining = dict(self.counts)
+        stack = [start]
+        path = []
+        while stack:
+            u = stack[-1]
+            for b in range(4):
+                code = (u << 2) | b
+                c = canonical_code(code, k)
+                n = remaining.get(c, 0)
+                if n:
+                    if n == 1:
+                        del remaining[c]
+                    else:
+                        remaining[c] = n - 1
+                    stack.append(code & node_mask)
+                    break
+            else:
+                path.append(stack.pop())
+        path.reverse()
+        if remaining or not self._is_walk(path):
+            return []
+        return path
+
+    def _is_walk(self, path: List[int]) -> bool:
+        # a spliced sub-circuit can come back on the other strand, so check
+        # that consecutive nodes overlap by k-2 bases and that the k-mers
+        # they spell are exactly the counted ones
+        k = self.k
+        overlap = kmer_mask(k - 2)
+        spelled = defaultdict(int)
+        for u, v in zip(path, path[1:]):
+            if (u & overlap) != (v >> 2):
+                return False
+            spelled[canonical_code((u << 2) | (v & 3), k)] += 1
+        return spelled == self.counts
+
+    def spell(self, path: List[int]) -> str:
+        return spell_path(path, self.k)
+
+def canonical_graph_from_kmers(patterns: Iterable, k: Optional[int] = None) -> CanonicalGraph:
+    # patterns are k-mer strings, or packed codes when k is given
+    if k is None:
+        patterns = iter(patterns)
+        first = next(patterns, None)
+        if first is None:
+            return CanonicalGraph(1)
+        graph = CanonicalGraph(len(first))
+        graph.add_kmer(encode(first))
+        graph.add_kmers(encode(kmer) for kmer in patterns)
+        return graph
+    graph = CanonicalGraph(k)
+    graph.add_kmers(patterns)
+    return graph
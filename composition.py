@@ -0,0 +1,91 @@
+'''
+K-mer composition comparison of two sequences.
+
+Both sequences are turned into uint64 arrays of packed k-mer codes (no
+strings, no shuffle), and the compositions are compared in two steps:
+
+  1. a multiset hash, the wrapping sum of mix64 over all codes, which does
+     not depend on the order of the k-mers: different sums prove the
+     compositions differ without sorting anything;
+  2. np.sort of both arrays and an element-wise comparison, which also gives
+     the first (smallest) k-mer whose counts differ.
+
+Sequences with k > 32 or bases other than a/c/g/t fall back to sorted lists
+of k-mer strings.
+'''
+
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from kmer_array import MAX_K
+from kmer_codec import decode
+from kmer_table import mix64_array
+from synthetic import kmer_array
+
+class CompositionDifference(NamedTuple):
+    kmer: str       # smallest k-mer whose counts differ
+    count1: int     # its count in the first sequence
+    count2: int     # its count in the second sequence
+
+def multiset_hash(codes: np.ndarray) -> int:
+    # order-independent hash of a multiset of codes (uint64 sums wrap)
+    return int(mix64_array(codes).sum(dtype=np.uint64))
+
+def _packed_kmers(seq, k):
+    if k > MAX_K:
+        return None
+    try:
+        return kmer_array(seq, k, shuffle=False)
+    except ValueError:
+        return None
+
+def _first_mismatch(a, b):
+    # index of the first position where sorted a and b differ
+    n = min(len(a), len(b))
+    diff = np.flatnonzero(a[:n] != b[:n])
+    return int(diff[0]) if len(diff) else n
+
+def composition_difference(s1: str, s2: str, k: int) -> Optional[CompositionDifference]:
+    # None if s1 and s2 have the same k-mer composition
+    if s1 == s2:
+        return None
+    a = _packed_kmers(s1, k)
+    b = _packed_kmers(s2, k) if a is not None else None
+    if a is None or b is None:
+        return _string_difference(s1, s2, k)
+    if len(a) == len(b) and multiset_hash(a) == multiset_hash(b):
+        a.sort()
+        b.sort()
+        if np.array_equal(a, b):
+            return None
+    else:
+        a.sort()
+        b.sort()
+    i = _first_mismatch(a, b)
+    if i == len(a):
+        code = b[i]
+    elif i == len(b):
+        code = a[i]
+    else:
+        code = min(a[i], b[i])
+    count1 = int(np.searchsorted(a, code, "right") - np.searchsorted(a, code, "left"))
+    count2 = int(np.searchsorted(b, code, "right") - np.searchsorted(b, code, "left"))
+    return CompositionDifference(decode(int(code), k), count1, count2)
+
+def _string_difference(s1, s2, k):
+    a = sorted(s1[i:i+k] for i in range(len(s1) - k + 1))
+    b = sorted(s2[i:i+k] for i in range(len(s2) - k + 1))
+    if a == b:
+        return None
+    i = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+    if i == len(a):
+        kmer = b[i]
+    elif i == len(b):
+        kmer = a[i]
+    else:
+        kmer = min(a[i], b[i])
+    return CompositionDifference(kmer, a.count(kmer), b.count(kmer))
+
+def same_composition(s1: str, s2: str, k: int) -> bool:
+    return composition_difference(s1, s2, k) is None
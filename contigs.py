@@ -0,0 +1,140 @@
+'''
+Multi-contig assembly of de Bruijn graphs without a single Eulerian path.
+
+Gaps in coverage split the graph into several pieces, and branching leaves
+nodes unbalanced, so real data rarely has one Eulerian path. assemble_contigs
+instead:
+
+  1. splits the CSRGraph into weakly connected components with a union-find
+     over node ids;
+  2. covers the edges of every component with as few paths as possible: an
+     unbalanced component gets one virtual edge from each surplus sink to a
+     surplus source, an Eulerian circuit of the now balanced component is
+     found with euler.hierholzer_edges, and the circuit is cut at the virtual
+     edges. Every k-mer ends up in exactly one contig;
+  3. processes the components in a ProcessPoolExecutor, in batches of about
+     equal edge counts.
+
+The result is a list of contigs (strings) for every component.
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+
+from euler import hierholzer_edges
+from kmer_array import CSRGraph
+from kmer_codec import spell_path
+
+def weakly_connected_components(num_nodes: int, src, dst) -> np.ndarray:
+    # component label (0, 1, ...) of every node, by union-find with path
+    # halving; labels are numbered in order of each component's first node
+    parent = list(range(num_nodes))
+    for u, v in zip(src.tolist(), dst.tolist()):
+        while parent[u] != u:
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        if u != v:
+            if u < v:
+                parent[v] = u
+            else:
+                parent[u] = v
+    roots = np.array(parent, dtype=np.int64)
+    # finish the compression with pointer jumping
+    while True:
+        nxt = roots[roots]
+        if np.array_equal(nxt, roots):
+            break
+        roots = nxt
+    _, labels = np.unique(roots, return_inverse=True)
+    return labels.reshape(-1)
+
+def path_cover(num_nodes: int, src: np.ndarray, dst: np.ndarray) -> List[np.ndarray]:
+    # edge-disjoint paths, as arrays of node ids, that together use every
+    # edge of a weakly connected graph once
+    if len(src) == 0:
+        return []
+    out_degree = np.bincount(src, minlength=num_nodes)
+    in_degree = np.bincount(dst, minlength=num_nodes)
+    surplus = out_degree - in_degree
+    sources = np.repeat(np.arange(num_nodes), np.maximum(surplus, 0))
+    sinks = np.repeat(np.arange(num_nodes), np.maximum(-surplus, 0))
+    # virtual edges sink -> source make every node balanced
+    all_src = np.concatenate((src, sinks))
+    all_dst = np.concatenate((dst, sources))
+    order = np.argsort(all_src, kind="stable")
+    offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(all_src, minlength=num_nodes), out=offsets[1:])
+    start = int(sources[0]) if len(sources) else int(src[0])
+    circuit = order[np.frombuffer(hierholzer_edges(offsets, all_dst[order], start),
+                                  dtype=np.int64)]
+    if len(circuit) != len(all_src):
+        raise ValueError("path_cover needs a weakly connected graph")
+    if len(sources) == 0:
+        return [np.concatenate(([start], dst[circuit]))]
+    # rotate the circuit to start right after a virtual edge; every virtual
+    # edge then ends a path
+    first = int(np.argmax(circuit >= len(src)))
+    circuit = np.roll(circuit, -(first + 1))
+    virtual = np.flatnonzero(circuit >= len(src))
+    paths = []
+    begin = 0
+    for end in virtual.tolist():
+        edges = circuit[begin:end]
+        if len(edges) > 0:
+            paths.append(np.concatenate((src[edges[:1]], dst[edges])))
+        begin = end + 1
+    return paths
+
+def component_contigs(k: int, node_codes: np.ndarray, src: np.ndarray,
+                      dst: np.ndarray) -> List[str]:
+    return [spell_path(node_codes[path], k)
+            for path in path_cover(len(node_codes), src, dst)]
+
+def _contigs_of_batch(k, batch):
+    return [component_contigs(k, *component) for component in batch]
+
+def split_components(g: CSRGraph):
+    # (node_codes, src, dst) of every weakly connected component, with node
+    # ids local to the component
+    src = np.repeat(np.arange(g.num_nodes, dtype=np.int64), g.out_degree)
+    dst = np.asarray(g.targets, dtype=np.int64)
+    labels = weakly_connected_components(g.num_nodes, src, dst)
+    num_components = int(labels.max()) + 1 if len(labels) else 0
+    node_order = np.argsort(labels, kind="stable")
+    node_bounds = np.zeros(num_components + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=num_components), out=node_bounds[1:])
+    local = np.empty(g.num_nodes, dtype=np.int64)
+    local[node_order] = np.arange(g.num_nodes) - node_bounds[labels[node_order]]
+    edge_labels = labels[src]
+    edge_order = np.argsort(edge_labels, kind="stable")
+    edge_bounds = np.zeros(num_components + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edge_labels, minlength=num_components), out=edge_bounds[1:])
+    components = []
+    for c in range(num_components):
+        nodes = node_order[node_bounds[c]:node_bounds[c+1]]
+        edges = edge_order[edge_bounds[c]:edge_bounds[c+1]]
+        components.append((g.node_codes[nodes], local[src[edges]], local[dst[edges]]))
+    return components
+
+def assemble_contigs(g: CSRGraph, workers=None) -> List[List[str]]:
+    # contigs of every weakly connected component, components in order of
+    # their first node
+    components = split_components(g)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(components) <= 1:
+        return _contigs_of_batch(g.k, components)
+    # batches of roughly equal edge counts, a few per worker
+    sizes = np.cumsum([len(src) for _, src, _ in components])
+    num_batches = min(len(components), 4 * workers)
+    cuts = np.searchsorted(sizes, sizes[-1] * np.arange(1, num_batches) / num_batches)
+    bounds = [0] + sorted(set(cuts.tolist())) + [len(components)]
+    batches = [components[lo:hi] for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_contigs_of_batch, [g.k] * len(batches), batches)
+        return [contigs for batch in results for contigs in batch]
@@ -0,0 +1,175 @@
+'''
+De Bruijn graph as a dict of deques that keeps its own degree counts.
+
+DeBruijnGraph is the same defaultdict(deque) adjacency the assemblers have
+always used (node -> deque of successors), so eulPath and friends work on it
+unchanged. Every edge added through add_edge/add_edges also updates the in and
+out degree counters and the balance (in - out) of both endpoints, and only
+unbalanced nodes are kept in balance. balanceCount and has_Eulerian_path can
+then answer from that small dict instead of scanning the whole graph.
+
+validate() classifies the nodes in one pass over that dict and caches the
+result, including the source and sink of the Eulerian path, until the next
+edge is added or removed.
+'''
+
+from collections import defaultdict, deque
+from typing import Any, NamedTuple, Optional
+
+class GraphValidation(NamedTuple):
+    num_balanced: int
+    num_sources: int    # out-degree = in-degree + 1
+    num_sinks: int      # in-degree = out-degree + 1
+    num_invalid: int    # any other imbalance
+    source: Optional[Any]
+    sink: Optional[Any]
+
+    @property
+    def is_cycle(self) -> bool:
+        # every node balanced: an Eulerian cycle, if the graph is connected
+        return self.num_sources == 0 and self.num_sinks == 0 and self.num_invalid == 0
+
+    @property
+    def has_eulerian_path(self) -> bool:
+        # degree condition only; connectivity is checked by the traversal
+        if self.num_invalid > 0:
+            return False
+        return self.num_sources == self.num_sinks and self.num_sources <= 1
+
+def classify_balance(balanced_count, num_nodes=None) -> GraphValidation:
+    # one pass over node -> (in-degree - out-degree); balanced nodes may be
+    # left out of balanced_count if num_nodes is given
+    sources = sinks = invalid = balanced = 0
+    source = sink = None
+    for node, b in balanced_count.items():
+        if b == 0:
+            balanced += 1
+        elif b == -1:
+            sources += 1
+            source = node
+        elif b == 1:
+            sinks += 1
+            sink = node
+        else:
+            invalid += 1
+    if num_nodes is not None:
+        balanced = num_nodes - sources - sinks - invalid
+    return GraphValidation(balanced, sources, sinks, invalid, source, sink)
+
+class DeBruijnGraph(defaultdict):
+    def __init__(self):
+        super().__init__(deque)
+        self.in_degree = defaultdict(int)
+        self.out_degree = defaultdict(int)
+        # node -> in-degree minus out-degree, for unbalanced nodes only
+        self.balance = {}
+        self.num_edges = 0
+        self._validation = None
+
+    def __reduce__(self):
+        state = (dict(self), dict(self.in_degree), dict(self.out_degree),
+                 self.balance, self.num_edges)
+        return (_rebuild_graph, state)
+
+    @property
+    def num_nodes(self) -> int:
+        # a node without outgoing edges is always unbalanced, so the nodes
+        # missing from out_degree can all be found in balance
+        out_degree = self.out_degree
+        return len(out_degree) + sum(1 for node in self.balance if node not in out_degree)
+
+    def add_edge(self, u, v):
+        self[u].append(v)
+        self.out_degree[u] += 1
+        self.in_degree[v] += 1
+        self.num_edges += 1
+        self._validation = None
+        _shift_balance(self.balance, u, -1)
+        _shift_balance(self.balance, v, 1)
+
+    def add_edges(self, edges):
+        # add_edge for an iterable of (u, v) pairs with the lookups hoisted
+        in_degree = self.in_degree
+        out_degree = self.out_degree
+        balance = self.balance
+        count = 0
+        for u, v in edges:
+            self[u].append(v)
+            out_degree[u] += 1
+            in_degree[v] += 1
+            count += 1
+            b = balance.pop(u, 0) - 1
+            if b:
+                balance[u] = b
+            b = balance.pop(v, 0) + 1
+            if b:
+                balance[v] = b
+        self.num_edges += count
+        self._validation = None
+
+    def remove_edge(self, u, v):
+        # removes one copy of u -> v, ValueError if there is none; nodes left
+        # without edges disappear from the graph
+        successors = self.get(u)
+        if successors is None:
+            raise ValueError(f"no edge {u} -> {v}")
+        successors.remove(v)
+        if not successors:
+            del self[u]
+        _decrement(self.out_degree, u)
+        _decrement(self.in_degree, v)
+        self.num_edges -= 1
+        self._validation = None
+        _shift_balance(self.balance, u, 1)
+        _shift_balance(self.balance, v, -1)
+
+    def validate(self) -> GraphValidation:
+        if self._validation is None:
+            self._validation = classify_balance(self.balance, self.num_nodes)
+        return self._validation
+
+    @property
+    def source(self):
+        return self.validate().source
+
+    @property
+    def sink(self):
+        return self.validate().sink
+
+    def start_node(self):
+        # where an Eulerian traversal has to begin: the source, or for a
+        # cycle any node with an outgoing edge
+        if self.source is not None:
+            return self.source
+        return next(iter(self.out_degree), None)
+
+def start_node(graph, balanced_count):
+    # start of an Eulerian traversal for any adjacency dict: the source, or
+    # for a cycle any node with an outgoing edge; None for an empty graph
+    if isinstance(graph, DeBruijnGraph):
+        return graph.start_node()
+    source = classify_balance(balanced_count).source
+    if source is not None:
+        return source
+    return next((node for node, successors in graph.items() if successors), None)
+
+def _shift_balance(balance, node, delta):
+    b = balance.pop(node, 0) + delta
+    if b:
+        balance[node] = b
+
+def _decrement(degree, node):
+    d = degree[node] - 1
+    if d:
+        degree[node] = d
+    else:
+        del degree[node]
+
+def _rebuild_graph(adjacency, in_degree, out_degree, balance, num_edges):
+    g = DeBruijnGraph()
+    g.update(adjacency)
+    g.in_degree.update(in_degree)
+    g.out_degree.update(out_degree)
+    g.balance = balance
+    g.num_edges = num_edges
+    return g
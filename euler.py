@@ -0,0 +1,141 @@
+'''
+Iterative Hierholzer traversal over a CSR adjacency.
+
+Instead of draining deques and catching the exception raised at a dead end,
+every node keeps an integer cursor into its slice of the immutable targets
+array: following an edge just advances the cursor, and a node is a dead end
+when its cursor reaches the end of its slice. Nothing on the hot path raises,
+and the graph arrays are never modified, so the same graph can be traversed
+again.
+
+eulerian_path first folds every run of in = out = 1 nodes into a single chain
+with NumPy, so the Python-level traversal only visits branching nodes. On de
+Bruijn graphs of random sequence that is a handful of nodes instead of one
+per k-mer.
+'''
+
+from array import array
+
+import numpy as np
+
+def eulerian_start(out_degree, in_degree) -> int:
+    # the source (out = in + 1) of an Eulerian path, or for an Eulerian cycle
+    # any node with an outgoing edge; -1 if the graph has no edges
+    out_degree = np.asarray(out_degree)
+    in_degree = np.asarray(in_degree)
+    sources = np.flatnonzero(out_degree - in_degree == 1)
+    if len(sources) > 0:
+        return int(sources[0])
+    nonempty = np.flatnonzero(out_degree)
+    if len(nonempty) > 0:
+        return int(nonempty[0])
+    return -1
+
+def hierholzer_edges(offsets, targets, start: int, stats=None) -> array:
+    # Eulerian path from start as positions in the targets array; assumes
+    # one exists. Walk forward until the top of the stack has no unused
+    # edge left, then retire the edge that led there to the path. stats, if
+    # given, receives the number of dead ends the walk ran into.
+    offsets = offsets.tolist() if isinstance(offsets, np.ndarray) else list(offsets)
+    targets = targets.tolist() if isinstance(targets, np.ndarray) else targets
+    cursor = offsets[:-1]
+    end = offsets[1:]
+    nodes = [start]
+    edges = [-1]
+    path = array("q")
+    emit = path.append
+    dead_ends = 0
+    while nodes:
+        u = nodes[-1]
+        c = cursor[u]
+        if c < end[u]:
+            while c < end[u]:
+                cursor[u] = c + 1
+                u = targets[c]
+                nodes.append(u)
+                edges.append(c)
+                c = cursor[u]
+            dead_ends += 1
+        nodes.pop()
+        emit(edges.pop())
+    if stats is not None:
+        stats["dead_ends"] = dead_ends
+    path.pop()
+    path.reverse()
+    return path
+
+def edge_chains(offsets, targets, in_degree, out_degree, start: int = -1):
+    # Groups the edges into maximal chains through in = out = 1 nodes.
+    # Returns (order, chain_start, chain_len, chain_from, chain_to): the edges
+    # of chain c are order[chain_start[c]:chain_start[c]+chain_len[c]] and it
+    # runs from node chain_from[c] to node chain_to[c]. start (a node, or an
+    # array of nodes) is never folded into a chain. Returns None if some
+    # edges form a cycle of simple nodes that no chain enters, i.e. a
+    # component cut off from the rest.
+    n = len(out_degree)
+    m = len(targets)
+    simple = (in_degree == 1) & (out_degree == 1)
+    starts = np.atleast_1d(np.asarray(start, dtype=np.int64))
+    simple[starts[(starts >= 0) & (starts < n)]] = False
+    src = np.repeat(np.arange(n, dtype=np.int64), out_degree)
+    # the only edge leaving a simple target continues the chain
+    pred = np.full(m, -1, dtype=np.int64)
+    cont = np.flatnonzero(simple[targets])
+    pred[offsets[targets[cont]]] = cont
+    # list ranking by pointer jumping: the head edge of every chain and the
+    # distance from it
+    root = np.where(pred < 0, np.arange(m, dtype=np.int64), pred)
+    dist = (pred >= 0).astype(np.int64)
+    for _ in range(max(m, 1).bit_length() + 1):
+        nxt = root[root]
+        if np.array_equal(nxt, root):
+            break
+        dist += dist[root]
+        root = nxt
+    else:
+        return None
+    if (pred[root] >= 0).any():
+        return None
+    order = np.lexsort((dist, root))
+    heads = np.flatnonzero(pred < 0)
+    chain_len = np.bincount(root, minlength=m)[heads]
+    chain_start = np.zeros(len(heads), dtype=np.int64)
+    np.cumsum(chain_len[:-1], out=chain_start[1:])
+    chain_from = src[heads]
+    chain_to = targets[order[chain_start + chain_len - 1]]
+    return order, chain_start, chain_len, chain_from, chain_to
+
+def eulerian_path(g, stats=None) -> array:
+    # Eulerian path of a CSRGraph as an array('I') of node indices. stats,
+    # if given, receives the number of dead ends the walk ran into, counted
+    # on the graph of folded chains.
+    if not g.validate().has_eulerian_path:
+        raise Exception("ERROR: Eulerian path does not exist!")
+    start = eulerian_start(g.out_degree, g.in_degree)
+    if start < 0:
+        if stats is not None:
+            stats["dead_ends"] = 0
+        return array("I")
+    chains = edge_chains(g.offsets, g.targets, g.in_degree, g.out_degree, start)
+    if chains is None:
+        raise Exception("ERROR: Eulerian path does not exist!")
+    order, chain_start, chain_len, chain_from, chain_to = chains
+    # CSR over the chains, then Hierholzer on that much smaller graph
+    n = g.num_nodes
+    by_from = np.argsort(chain_from, kind="stable")
+    chain_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(chain_from, minlength=n), out=chain_offsets[1:])
+    walk = hierholzer_edges(chain_offsets, chain_to[by_from], start, stats)
+    if len(walk) != len(chain_len):
+        raise Exception("ERROR: Eulerian path does not exist!")
+    walked = by_from[np.frombuffer(walk, dtype=np.int64)]
+    # expand the chains back into edges without a Python loop
+    lens = chain_len[walked]
+    shift = np.repeat(chain_start[walked] - (np.cumsum(lens) - lens), lens)
+    edges = order[shift + np.arange(int(lens.sum()), dtype=np.int64)]
+    nodes = np.empty(len(edges) + 1, dtype=np.uint32)
+    nodes[0] = start
+    nodes[1:] = g.targets[edges]
+    path = array("I")
+    path.frombytes(nodes.tobytes())
+    return path
@@ -1,8 +1,15 @@
 import random
 import time
+import numpy as np
 from typing import List
 from typing import Tuple
 from collections import defaultdict, deque
+from debruijn_graph import DeBruijnGraph, classify_balance, start_node
+from kmer_codec import kmer_mask, spell_path
+from composition import composition_difference
+from synthetic import random_sequence
+from kmer_array import CSRGraph, debrujin_graph_from_kmer_array, MAX_K, pack_kmers
+from euler import eulerian_path
 
 def main():
     test_seq_assembly()
@@ -13,11 +20,20 @@ def test_and_print_message(seq, seq_truth, k, message):
     elif compare_composition(seq, seq_truth, k):
         print(f"Passed {message} (assembled a sequence of the same composition with the original sequence). Congratulations!")
     else:
-        print("FAILED test 1!")
+        diff = composition_difference(seq, seq_truth, k)
+        if diff is None:
+            print("FAILED test 1!")
+        else:
+            print(f"FAILED test 1! First differing k-mer: {diff.kmer} "
+                  f"(assembled {diff.count1}, expected {diff.count2})")
 
-def test_1(method):
+def test_1(method, seed=None):
+    # a seed makes the sequence and the k-mer shuffle, and so the timings,
+    # reproducible
     print(f"Testing k-assembler by {method}")
-    seqs_truth = ["aaaaaaaaaaa","agcagctcagc","agcagctcagg",random_DNA_sequence(10000, 20000)]
+    if seed is not None:
+        random.seed(seed)
+    seqs_truth = ["aaaaaaaaaaa","agcagctcagc","agcagctcagg",random_DNA_sequence(10000, 20000, seed)]
     ks = [5, 3, 3, 20]
     for i in range(len(seqs_truth)):     
         print(f"\nExample {i}:")
@@ -25,6 +41,9 @@ def test_1(method):
         #print(curr)
         k = ks[i]
         kmers = get_kmers(curr, k, True)
+        packed_k = None
+        if method == "packed k-mer hashing":
+            kmers, packed_k = pack_kmers(kmers)
         begin = time.time()
         if method == "k-mer pairwise comparison":
             g = create_deBruijn_graph_by_string_comp(kmers)
@@ -32,6 +51,8 @@ def test_1(method):
             g = debrujin_graph_from_kmers(kmers)
         elif method == "k-mer hashing without deque":
             g = debrujin_graph_from_kmers_nondeque(kmers)
+        elif method == "packed k-mer hashing":
+            g = debrujin_graph_from_kmers(kmers, packed_k)
         else:
             print("ERROR: unknown methods!") 
         end = time.time()
@@ -52,14 +73,16 @@ def test_1(method):
             end = time.time()
             elapsed_secs = end - begin
             print(f"Elapsed time for building Eulerian path: {elapsed_secs}")
-            seq = genomePath(path)
+            seq = genomePath(path, k=packed_k)
             message = f"Test 1 Example {i}"
             test_and_print_message(seq, curr, k, message)
         except Exception as e:
             print(f"ERROR: {e}")
 
-def test_2(method):
-    seq_truth = random_DNA_sequence()
+def test_2(method, seed=None):
+    if seed is not None:
+        random.seed(seed)
+    seq_truth = random_DNA_sequence(seed=seed)
     k = 10
     kmers = get_kmers(seq_truth, k)
     try:
@@ -82,29 +105,34 @@ def test_3(method):
     except Exception as e:
         print(e)
 
-def test_seq_assembly():
+def test_seq_assembly(seed=None):
     methods = [
         "k-mer pairwise comparison",
         "k-mer hashing",
-        "k-mer hashing without deque"
+        "k-mer hashing without deque",
+        "packed k-mer hashing"
     ]
     for method in methods:   
         print("-----------")
-        test_1(method)
+        test_1(method, seed)
         print()
-        test_2(method)
+        test_2(method, seed)
         print()
     print("-----------")
     test_3("k-mer hashing")
 
 def assemble_kmers(kmers, method):
     seq = ""
+    packed_k = None
     if method == "k-mer pairwise comparison":
         g = create_deBruijn_graph_by_string_comp(kmers)
     elif method == "k-mer hashing":
         g = debrujin_graph_from_kmers(kmers)
     elif method == "k-mer hashing without deque":
         g = debrujin_graph_from_kmers_nondeque(kmers)
+    elif method == "packed k-mer hashing":
+        codes, packed_k = pack_kmers(kmers)
+        g = debrujin_graph_from_kmers(codes, packed_k)
     else:
         raise Exception("ERROR: unknown methods!")
     balanced_count = balanceCount(g)
@@ -113,16 +141,14 @@ def assemble_kmers(kmers, method):
         raise Exception("ERROR: Eulerian path does not exist!")
     else:
         path = eulPath(g,balanced_count)
-        seq = genomePath(path)
+        seq = genomePath(path, k=packed_k)
     return seq
 
-def random_DNA_sequence(min_length=10, max_length=10000):
-    DNA = ""
-    length = random.randint(min_length, max_length)
-    nucleotides = "atgc"
-    for n in range(length):
-        DNA += nucleotides[random.randint(0, 3)]
-    return DNA
+def random_DNA_sequence(min_length=10, max_length=10000, seed=None):
+    # drawn with NumPy in one go; the same seed gives the same sequence
+    rng = np.random.default_rng(seed)
+    length = int(rng.integers(min_length, max_length + 1))
+    return random_sequence(length, rng=rng)
 
 def get_kmers(seq, k, randomized=True):
     kmers = [seq[i:i+k] for i in range(len(seq) - k + 1)]
@@ -134,46 +160,46 @@ def get_kmers(seq, k, randomized=True):
     return kmers
 
 def compare_composition(s1, s2, k):
-    same_composition = True
-    if len(s1) != len(s2):
-        same_composition = False
-    elif s1 == s2:
-        same_composition = True
-    else:
-        composition1 = get_kmers(s1, k)
-        composition1.sort()
-        composition2 = get_kmers(s2, k)
-        composition2.sort()
-        same_composition = composition1 == composition2
-    return same_composition
+    # packed k-mer arrays compared by np.sort, see composition.py
+    return len(s1) == len(s2) and composition_difference(s1, s2, k) is None
 
-def genomePath(kmers, apppend_last=True):
-    genome = ''
-    for kmer in kmers:
-        genome += kmer[0]
-    if apppend_last:
-        genome += kmer[1:]
-    return genome
+def genomePath(kmers, apppend_last=True, k=None):
+    # k is given when the path holds packed (k-1)-mer codes
+    genome = spell_path(kmers, k)
+    return genome if apppend_last else genome[:len(kmers)]
 
-def debrujin_graph_from_kmers(patterns):
-    kmers = set()
-    for pattern in patterns:
-        kmers = set(suffix_composition(len(pattern), pattern))
-    graph = defaultdict(deque)
-    for kmer in patterns:
-        graph[prefix(kmer)].append(suffix(kmer))
+def debrujin_graph_from_kmers(patterns, k=None):
+    # k is given when the patterns are packed k-mer codes
+    if k is not None:
+        return debrujin_graph_from_codes(patterns, k)
+    graph = DeBruijnGraph()
+    graph.add_edges((prefix(kmer), suffix(kmer)) for kmer in patterns)
+    return graph
+
+def debrujin_graph_from_codes(codes, k):
+    # for k <= MAX_K the nodes are integer ids in CSR arrays (see
+    # kmer_array); wider codes go into the dict graph, where prefix is a
+    # shift and suffix is a mask, no string slicing
+    if k <= MAX_K:
+        if not isinstance(codes, np.ndarray):
+            codes = np.fromiter(codes, dtype=np.uint64)
+        return debrujin_graph_from_kmer_array(codes, k)
+    mask = kmer_mask(k - 1)
+    graph = DeBruijnGraph()
+    graph.add_edges((code >> 2, code & mask) for code in codes)
     return graph
     
 def debrujin_graph_from_kmers_nondeque(patterns):
-    kmers = []
-    for pattern in patterns:
-        kmers = kmers + suffix_composition(len(pattern), pattern)
-    kmers = set(kmers)
     dict = {}
-    for kmer1 in kmers:
-        dict[kmer1] = deque()
+    # register both endpoints of every edge as it is added, one pass
     for kmer in patterns:
-        dict[prefix(kmer)].append(suffix(kmer))
+        pre = prefix(kmer)
+        suf = suffix(kmer)
+        if pre not in dict:
+            dict[pre] = deque()
+        if suf not in dict:
+            dict[suf] = deque()
+        dict[pre].append(suf)
     return dict
 
 def create_deBruijn_graph_by_string_comp(kmers):
@@ -201,6 +227,13 @@ def prefix(string):
     return string[:-1]
 
 def balanceCount(adjacentList):
+    # graphs from debrujin_graph_from_kmers count degrees as edges are added,
+    # so only their unbalanced nodes need to be handed back
+    if isinstance(adjacentList, DeBruijnGraph):
+        return adjacentList.balance
+    if isinstance(adjacentList, CSRGraph):
+        return adjacentList.balance_count()
+
     # create a set of all nodes in the graph
     all_nodes = set(adjacentList.keys())
     #print(all_nodes)
@@ -211,12 +244,6 @@ def balanceCount(adjacentList):
     # create a dictionary to hold the balanced counts
     balanced_count = dict.fromkeys(all_nodes, 0)
     
-    if len(all_nodes) == 1:
-        #print("Single Node Exception")
-        for node in all_nodes:
-            balanced_count[node] = -1
-        return balanced_count
-
     # iterate over each node in the adjacency list
     for node in adjacentList.keys():
         # subtract the out-degree of the node from its balanced count
@@ -231,10 +258,17 @@ def balanceCount(adjacentList):
     return balanced_count
 
 def eulPath(graph, balanced_count):
+    # a CSRGraph is walked by euler.eulerian_path and the path comes back
+    # as (k-1)-mer codes, which genomePath spells with k
+    if isinstance(graph, CSRGraph):
+        return graph.node_codes[np.frombuffer(eulerian_path(graph), dtype=np.uint32)]
     dictionary = deque()
     #print("BALANCED COUNT ITEMS")
     #print(balanced_count.items())
-    dictionary.appendleft([k for k, v in balanced_count.items() if v == -1][0])
+    start = start_node(graph, balanced_count)
+    if start is None:
+        return deque()
+    dictionary.appendleft(start)
     path = deque()
     while dictionary:
         u_v = dictionary[0]
@@ -247,10 +281,8 @@ def eulPath(graph, balanced_count):
     return path
 
 def has_Eulerian_path(balanced_count):
-    for k, v in balanced_count.items():
-        if v == -1:
-            return True
-    return False    
+    # exactly one source and one sink, or all nodes balanced (a cycle)
+    return classify_balance(balanced_count).has_eulerian_path    
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+'''
+DOT and GFA1 export of de Bruijn graphs.
+
+The exporters take any of the array graphs (kmer_array.CSRGraph, the
+DiGraph of test_combined, or a DeBruijnGraph, which is converted to CSR
+first; pass k for one over packed codes) and stream them out in batches: each batch of nodes or edges has its
+labels decoded from the packed codes in one NumPy pass, formatted, and
+handed to a BatchedWriter that joins lines into large chunks before writing.
+Only one batch of text is ever in memory, whatever the size of the graph.
+
+  write_dot  Graphviz DOT, one edge per k-mer
+  write_gfa  GFA1: nodes as segments S, k-mer edges as links L with a
+             (k-2)-base overlap
+
+With unitigs=True both export the compacted graph instead: each maximal
+non-branching path (see euler.edge_chains) is one GFA segment carrying its
+spelled sequence, linked to the unitigs that follow it with a (k-1)-base
+overlap, or one DOT edge between two branching nodes. max_edges caps the
+number of edges or links written; a truncated file ends with a comment
+saying so. subgraph cuts out the neighbourhood of a node up to a depth,
+for exporting a readable piece of a large graph.
+'''
+
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from contigs import weakly_connected_components
+from euler import edge_chains
+from graph_store import csr_from_debruijn_graph
+from kmer_array import CSRGraph
+from kmer_codec import BASE_CHAR, decode_codes, encode
+
+class BatchedWriter:
+    # collects strings and writes them to fh in chunks of about buffer_size
+    # characters; use as a context manager or call flush() at the end
+    def __init__(self, fh, buffer_size: int = 1 << 20):
+        self.fh = fh
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.pending = 0
+        self.written = 0
+
+    def write(self, text: str) -> None:
+        self.parts.append(text)
+        self.pending += len(text)
+        if self.pending >= self.buffer_size:
+            self.flush()
+
+    def writelines(self, lines: List[str]) -> None:
+        self.write("".join(lines))
+
+    def flush(self) -> None:
+        if self.parts:
+            self.fh.write("".join(self.parts))
+            self.written += self.pending
+            self.parts = []
+            self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+def as_array_graph(g, k: Optional[int] = None):
+    # CSRGraph and DiGraph as they are, dict graphs converted to CSR; k is
+    # needed for a DeBruijnGraph over packed codes, as in save_graph
+    if isinstance(g, CSRGraph) or hasattr(g, "label_codes"):
+        return g
+    return csr_from_debruijn_graph(g, k)
+
+def graph_arrays(g, k: Optional[int] = None):
+    # (k, node codes, offsets, targets) of any supported graph
+    g = as_array_graph(g, k)
+    codes = g.node_codes if isinstance(g, CSRGraph) else g.label_codes
+    return g.k, codes, g.offsets, g.targets
+
+def _edge_sources(offsets):
+    return np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+
+def _ranges(starts, ends):
+    # concatenation of arange(s, e) for every pair, without a Python loop
+    lens = ends - starts
+    total = int(lens.sum())
+    shift = np.repeat(starts - (np.cumsum(lens) - lens), lens)
+    return shift + np.arange(total, dtype=np.int64)
+
+class Unitigs(NamedTuple):
+    # unitig c spells the node codes[unitig_from[c]] followed by
+    # last_bases[start[c]:start[c]+length[c]] and ends at node unitig_to[c]
+    k: int
+    codes: np.ndarray
+    start: np.ndarray
+    length: np.ndarray
+    unitig_from: np.ndarray
+    unitig_to: np.ndarray
+    last_bases: np.ndarray
+
+def compacted_unitigs(g, k: Optional[int] = None) -> Unitigs:
+    k, codes, offsets, targets = graph_arrays(g, k)
+    in_degree = np.bincount(targets, minlength=len(codes))
+    out_degree = np.diff(offsets)
+    chains = edge_chains(offsets, targets, in_degree, out_degree)
+    if chains is None:
+        # some components are bare cycles: cut each at its smallest node
+        src = _edge_sources(offsets)
+        labels = weakly_connected_components(len(codes), src, targets)
+        simple = (in_degree == 1) & (out_degree == 1)
+        branching = np.bincount(labels, weights=~simple, minlength=labels.max() + 1)
+        first = np.full(len(branching), len(codes), dtype=np.int64)
+        np.minimum.at(first, labels, np.arange(len(codes)))
+        chains = edge_chains(offsets, targets, in_degree, out_degree,
+                             first[branching == 0])
+    order, chain_start, chain_len, chain_from, chain_to = chains
+    last_bases = BASE_CHAR[(codes[targets[order]] & np.uint64(3)).astype(np.intp)]
+    return Unitigs(k, codes, chain_start, chain_len, chain_from, chain_to, last_bases)
+
+def unitig_sequences(u: Unitigs, begin: int = 0, end: Optional[int] = None) -> List[str]:
+    end = len(u.start) if end is None else end
+    heads = decode_codes(u.codes[u.unitig_from[begin:end]], u.k - 1)
+    return [head + u.last_bases[s:s+n].tobytes().decode("ascii")
+            for head, s, n in zip(heads, u.start[begin:end].tolist(),
+                                  u.length[begin:end].tolist())]
+
+def _unitig_links(chain_from, chain_to, num_nodes):
+    # (a, b) pairs of unitigs where b starts at the node a ends at
+    by_from = np.argsort(chain_from, kind="stable")
+    starts = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(chain_from, minlength=num_nodes), out=starts[1:])
+    lo = starts[chain_to]
+    hi = starts[chain_to + 1]
+    a = np.repeat(np.arange(len(chain_to), dtype=np.int64), hi - lo)
+    b = by_from[_ranges(lo, hi)]
+    return a, b
+
+def _open(target):
+    if hasattr(target, "write"):
+        return target, False
+    return open(target, "w"), True
+
+def write_dot(g, target, unitigs: bool = False, max_edges: Optional[int] = None,
+              batch_size: int = 1 << 16, buffer_size: int = 1 << 20,
+              k: Optional[int] = None) -> int:
+    # writes g to target (a path or text file), returns the edges written
+    g = as_array_graph(g, k)
+    k, codes, offsets, targets = graph_arrays(g)
+    fh, close = _open(target)
+    try:
+        with BatchedWriter(fh, buffer_size) as out:
+            out.write('digraph {\nlabel="de Bruijn graph"\n')
+            if unitigs:
+                u = compacted_unitigs(g)
+                src, dst = u.unitig_from, u.unitig_to
+                lengths = u.length
+            else:
+                src = _edge_sources(offsets)
+                dst = targets
+                lengths = None
+            m = len(src) if max_edges is None else min(len(src), max_edges)
+            for begin in range(0, m, batch_size):
+                end = min(begin + batch_size, m)
+                prefixes = decode_codes(codes[src[begin:end]], k - 1)
+                suffixes = decode_codes(codes[dst[begin:end]], k - 1)
+                if unitigs:
+                    out.writelines([f'{p}->{s} [label="{n} k-mers"];\n' for p, s, n in
+                                    zip(prefixes, suffixes, lengths[begin:end].tolist())])
+                else:
+                    out.writelines([f"{p}->{s} [label={p}{s[-1:]}];\n"
+                                    for p, s in zip(prefixes, suffixes)])
+            if m < len(src):
+                out.write(f"// truncated: {m} of {len(src)} edges written\n")
+            out.write("}\n")
+    finally:
+        if close:
+            fh.close()
+    return m
+
+def write_gfa(g, target, unitigs: bool = False, max_edges: Optional[int] = None,
+              batch_size: int = 1 << 16, buffer_size: int = 1 << 20,
+              k: Optional[int] = None) -> int:
+    # writes g to target as GFA1, returns the links written
+    g = as_array_graph(g, k)
+    k, codes, offsets, targets = graph_arrays(g)
+    fh, close = _open(target)
+    try:
+        with BatchedWriter(fh, buffer_size) as out:
+            out.write("H\tVN:Z:1.0\n")
+            if unitigs:
+                u = compacted_unitigs(g)
+                num_segments = len(u.start)
+                src, dst = _unitig_links(u.unitig_from, u.unitig_to, len(codes))
+                overlap = k - 1
+            else:
+                num_segments = len(codes)
+                src = _edge_sources(offsets)
+                dst = targets
+                overlap = k - 2
+            for begin in range(0, num_segments, batch_size):
+                end = min(begin + batch_size, num_segments)
+                if unitigs:
+                    seqs = unitig_sequences(u, begin, end)
+                else:
+                    seqs = decode_codes(codes[begin:end], k - 1)
+                out.writelines([f"S\t{i}\t{seq}\n" for i, seq in enumerate(seqs, begin + 1)])
+            m = len(src) if max_edges is None else min(len(src), max_edges)
+            for begin in range(0, m, batch_size):
+                end = min(begin + batch_size, m)
+                out.writelines([f"L\t{a}\t+\t{b}\t+\t{overlap}M\n" for a, b in
+                                zip((src[begin:end] + 1).tolist(), (dst[begin:end] + 1).tolist())])
+            if m < len(src):
+                out.write(f"# truncated: {m} of {len(src)} links written\n")
+    finally:
+        if close:
+            fh.close()
+    return m
+
+def subgraph(g, center, depth: int = 2, k: Optional[int] = None) -> CSRGraph:
+    # the nodes within depth steps of center (a node id or its label),
+    # following edges in either direction, with the edges between them
+    k, codes, offsets, targets = graph_arrays(g, k)
+    n = len(codes)
+    if isinstance(center, str):
+        hits = np.flatnonzero(codes == np.uint64(encode(center)))
+        if len(hits) == 0:
+            raise KeyError(center)
+        center = int(hits[0])
+    src = _edge_sources(offsets)
+    # reverse CSR for the predecessors
+    by_target = np.argsort(targets, kind="stable")
+    rev_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(targets, minlength=n), out=rev_offsets[1:])
+    inside = np.zeros(n, dtype=bool)
+    inside[center] = True
+    frontier = np.array([center], dtype=np.int64)
+    for _ in range(depth):
+        succ = targets[_ranges(offsets[frontier], offsets[frontier + 1])]
+        pred = src[by_target[_ranges(rev_offsets[frontier], rev_offsets[frontier + 1])]]
+        reached = np.unique(np.concatenate((succ, pred)))
+        frontier = reached[~inside[reached]]
+        if len(frontier) == 0:
+            break
+        inside[frontier] = True
+    nodes = np.flatnonzero(inside)
+    local = np.full(n, -1, dtype=np.int64)
+    local[nodes] = np.arange(len(nodes))
+    keep = inside[src] & inside[targets]
+    sub_src = local[src[keep]]
+    sub_dst = local[targets[keep]]
+    out_degree = np.bincount(sub_src, minlength=len(nodes))
+    in_degree = np.bincount(sub_dst, minlength=len(nodes))
+    sub_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(out_degree, out=sub_offsets[1:])
+    # src is sorted, so the kept edges are still grouped by source
+    return CSRGraph(k, codes[nodes], sub_offsets, sub_dst, in_degree, out_degree)
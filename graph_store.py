@@ -0,0 +1,90 @@
+'''
+Binary on-disk format for de Bruijn graphs, reopened with numpy.memmap.
+
+A graph file is a 64-byte header followed by the CSRGraph arrays, each
+starting on an 8-byte boundary:
+
+  header       magic b"DBGRAPH1", format version, k, num_nodes, num_edges
+  node_codes   uint64[num_nodes]     packed (k-1)-mer of every node
+  offsets      int64[num_nodes + 1]  CSR offsets into targets
+  targets      int64[num_edges]      target node of every edge
+  in_degree    int64[num_nodes]
+  out_degree   int64[num_nodes]
+
+load_graph maps the arrays read-only instead of reading them, so opening a
+graph costs the same whatever its size, and every process that opens the same
+file shares one copy of it in the page cache.
+'''
+
+import struct
+from typing import Union
+
+import numpy as np
+
+from debruijn_graph import DeBruijnGraph
+from kmer_array import CSRGraph, debrujin_graph_from_kmer_array, MAX_K
+from kmer_codec import encode
+
+MAGIC = b"DBGRAPH1"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sIIQQ")
+_HEADER_SIZE = 64
+
+def _layout(num_nodes, num_edges):
+    # (name, dtype, length, byte offset) of every array in the file
+    arrays = (("node_codes", np.uint64, num_nodes),
+              ("offsets", np.int64, num_nodes + 1),
+              ("targets", np.int64, num_edges),
+              ("in_degree", np.int64, num_nodes),
+              ("out_degree", np.int64, num_nodes))
+    pos = _HEADER_SIZE
+    layout = []
+    for name, dtype, length in arrays:
+        layout.append((name, dtype, length, pos))
+        pos += length * np.dtype(dtype).itemsize
+    return layout
+
+def csr_from_debruijn_graph(graph: DeBruijnGraph, k=None) -> CSRGraph:
+    # CSRGraph with the edges of a dict graph; k is given when its nodes are
+    # packed codes, string nodes are encoded
+    edges = [(u, v) for u, successors in graph.items() for v in successors]
+    if k is None:
+        k = len(edges[0][0]) + 1 if edges else 1
+        edges = [(encode(u), encode(v)) for u, v in edges]
+    if k > MAX_K:
+        raise ValueError(f"graph files need k <= {MAX_K}, got {k}")
+    # an edge u -> v is the k-mer u followed by the last base of v
+    codes = np.fromiter(((u << 2) | (v & 3) for u, v in edges),
+                        dtype=np.uint64, count=len(edges))
+    return debrujin_graph_from_kmer_array(codes, k)
+
+def save_graph(graph: Union[CSRGraph, DeBruijnGraph], path, k=None) -> None:
+    if not isinstance(graph, CSRGraph):
+        graph = csr_from_debruijn_graph(graph, k)
+    num_nodes, num_edges = graph.num_nodes, graph.num_edges
+    with open(path, "wb") as fh:
+        header = _HEADER.pack(MAGIC, VERSION, graph.k, num_nodes, num_edges)
+        fh.write(header.ljust(_HEADER_SIZE, b"\0"))
+        for name, dtype, length, _ in _layout(num_nodes, num_edges):
+            np.ascontiguousarray(getattr(graph, name), dtype=dtype).tofile(fh)
+
+def load_graph(path, mode: str = "r") -> CSRGraph:
+    # zero-copy CSRGraph over the file; mode="r+" maps it writable
+    with open(path, "rb") as fh:
+        header = fh.read(_HEADER_SIZE)
+    if len(header) < _HEADER.size:
+        raise ValueError(f"{path} is not a graph file")
+    magic, version, k, num_nodes, num_edges = _HEADER.unpack_from(header)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a graph file")
+    if version != VERSION:
+        raise ValueError(f"unsupported graph file version {version}")
+    arrays = {}
+    for name, dtype, length, offset in _layout(num_nodes, num_edges):
+        if length == 0:
+            arrays[name] = np.zeros(0, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode=mode,
+                                     offset=offset, shape=(length,))
+    return CSRGraph(k, **arrays)
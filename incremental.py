@@ -0,0 +1,122 @@
+'''
+Incremental assembly of k-mers that arrive in batches.
+
+IncrementalGraph keeps one DeBruijnGraph for the lifetime of the assembly.
+add_kmers and remove_kmers update its adjacency, degrees and balance edge by
+edge and remember the nodes they touched. assemble() then only revisits the
+weakly connected components containing a touched node: they are re-grown by
+a breadth-first search from those nodes and re-covered with contigs
+(contigs.path_cover), while the contigs of every other component come from
+the cache. The cost of a batch is therefore proportional to the batch plus
+the components it touches, not to the whole graph.
+
+Predecessors are not stored: in a de Bruijn graph the only candidates for a
+predecessor of node x are the four nodes b + x[:-1], so they are looked up.
+'''
+
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from contigs import path_cover
+from debruijn_graph import DeBruijnGraph
+from kmer_codec import NUCLEOTIDES, kmer_mask, spell_path
+
+class IncrementalGraph:
+    def __init__(self, k: Optional[int] = None):
+        # k is given when the k-mers are packed codes
+        self.k = k
+        self.graph = DeBruijnGraph()
+        self.dirty = set()
+        self._component_of = {}     # node -> component id
+        self._components = {}       # component id -> list of nodes
+        self._contigs = {}          # component id -> contigs
+        self._next_component = 0
+
+    def __len__(self) -> int:
+        return self.graph.num_edges
+
+    def _ends(self, kmer):
+        if self.k is None:
+            return kmer[:-1], kmer[1:]
+        return kmer >> 2, kmer & kmer_mask(self.k - 1)
+
+    def add_kmers(self, batch: Iterable) -> None:
+        graph = self.graph
+        dirty = self.dirty
+        for kmer in batch:
+            u, v = self._ends(kmer)
+            graph.add_edge(u, v)
+            dirty.add(u)
+            dirty.add(v)
+
+    def remove_kmers(self, batch: Iterable) -> None:
+        # every k-mer removed must have been added; ValueError otherwise
+        graph = self.graph
+        dirty = self.dirty
+        for kmer in batch:
+            u, v = self._ends(kmer)
+            graph.remove_edge(u, v)
+            dirty.add(u)
+            dirty.add(v)
+
+    def _predecessors(self, node):
+        graph = self.graph
+        if self.k is None:
+            candidates = [b + node[:-1] for b in NUCLEOTIDES]
+        else:
+            shift = 2 * (self.k - 2)
+            candidates = [(b << shift) | (node >> 2) for b in range(4)]
+        return [p for p in candidates if node in graph.get(p, ())]
+
+    def _has_edges(self, node) -> bool:
+        return node in self.graph.out_degree or node in self.graph.in_degree
+
+    def _grow_component(self, seed) -> List:
+        # all nodes weakly connected to seed, by breadth-first search
+        graph = self.graph
+        nodes = [seed]
+        seen = {seed}
+        for node in nodes:
+            for w in list(graph.get(node, ())) + self._predecessors(node):
+                if w not in seen:
+                    seen.add(w)
+                    nodes.append(w)
+        return nodes
+
+    def _cover(self, nodes) -> List[str]:
+        graph = self.graph
+        local = {node: i for i, node in enumerate(nodes)}
+        src = []
+        dst = []
+        for node in nodes:
+            for w in graph.get(node, ()):
+                src.append(local[node])
+                dst.append(local[w])
+        paths = path_cover(len(nodes), np.array(src, dtype=np.int64),
+                           np.array(dst, dtype=np.int64))
+        return [spell_path([nodes[i] for i in path.tolist()], self.k) for path in paths]
+
+    def assemble(self) -> List[List[str]]:
+        # contigs of every weakly connected component, recomputing only the
+        # components touched since the last call
+        stale = set(self.dirty)
+        for node in self.dirty:
+            c = self._component_of.get(node)
+            if c is not None and c in self._components:
+                stale.update(self._components.pop(c))
+                del self._contigs[c]
+        for node in stale:
+            self._component_of.pop(node, None)
+        for node in stale:
+            if node in self._component_of or not self._has_edges(node):
+                continue
+            nodes = self._grow_component(node)
+            c = self._next_component
+            self._next_component += 1
+            for w in nodes:
+                self._component_of[w] = c
+            self._components[c] = nodes
+            self._contigs[c] = self._cover(nodes)
+        self.dirty.clear()
+        return list(self._contigs.values())
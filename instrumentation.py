@@ -0,0 +1,138 @@
+'''
+Stage-level instrumentation for the assembly pipeline.
+
+assemble_kmers and construct_sequence take an optional instrument. When it is
+an Instrumentation, every stage (build, balance, traverse, spell, ...) is
+recorded as a StageMetrics with its wall time, CPU time, net allocated
+memory blocks (sys.getallocatedblocks) and the counts the stage reports:
+nodes and edges after the build, path length and dead ends (the number of
+times the Eulerian walk got stuck and had to backtrack) after the traversal.
+Observers are called with each StageMetrics as soon as its stage ends.
+
+profile="cprofile" also runs the whole call under cProfile (see .stats()),
+and profile="calls" counts the Python function calls made in it through
+sys.setprofile (see .call_counts).
+
+Without an instrument the pipeline uses DISABLED, whose stage() and capture()
+return one shared no-op context manager, so the cost is a method call per
+stage.
+'''
+
+import cProfile
+import io
+import pstats
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+class StageMetrics(NamedTuple):
+    stage: str
+    wall_ns: int
+    cpu_ns: int
+    allocated_blocks: int
+    counts: Dict[str, int]
+
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, observers=(), profile: Optional[str] = None):
+        if profile not in (None, "cprofile", "calls"):
+            raise ValueError(f"unknown profile mode {profile}")
+        self.observers: List[Callable[[StageMetrics], None]] = list(observers)
+        self.profile = profile
+        self.metrics: List[StageMetrics] = []
+        self.profiler = None
+        self.call_counts = Counter()
+
+    def add_observer(self, observer: Callable[[StageMetrics], None]) -> None:
+        self.observers.append(observer)
+
+    @contextmanager
+    def stage(self, name: str):
+        # yields a dict the stage can put its counts in
+        counts = {}
+        blocks = sys.getallocatedblocks()
+        cpu = time.process_time_ns()
+        wall = time.perf_counter_ns()
+        try:
+            yield counts
+        finally:
+            metrics = StageMetrics(name, time.perf_counter_ns() - wall,
+                                   time.process_time_ns() - cpu,
+                                   sys.getallocatedblocks() - blocks, counts)
+            self.metrics.append(metrics)
+            for observer in self.observers:
+                observer(metrics)
+
+    @contextmanager
+    def capture(self):
+        # profiles everything run inside, according to self.profile
+        if self.profile == "cprofile":
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            try:
+                yield
+            finally:
+                self.profiler.disable()
+        elif self.profile == "calls":
+            previous = sys.getprofile()
+            counts = self.call_counts
+
+            def count_call(frame, event, arg):
+                if event == "call":
+                    code = frame.f_code
+                    counts[f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"] += 1
+            sys.setprofile(count_call)
+            try:
+                yield
+            finally:
+                sys.setprofile(previous)
+        else:
+            yield
+
+    def stats(self, sort: str = "cumulative", limit: int = 20) -> str:
+        if self.profiler is None:
+            return ""
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def summary(self) -> str:
+        lines = [f"{'stage':12s} {'wall ms':>10s} {'cpu ms':>10s} {'blocks':>10s}  counts"]
+        for m in self.metrics:
+            counts = " ".join(f"{key}={value}" for key, value in m.counts.items())
+            lines.append(f"{m.stage:12s} {m.wall_ns / 1e6:10.2f} {m.cpu_ns / 1e6:10.2f} "
+                         f"{m.allocated_blocks:10d}  {counts}")
+        return "\n".join(lines)
+
+class _Disabled:
+    enabled = False
+    _null = nullcontext({})
+
+    def stage(self, name):
+        return self._null
+
+    def capture(self):
+        return self._null
+
+DISABLED = _Disabled()
+
+def instrumented(instrument: Optional[Instrumentation]):
+    return DISABLED if instrument is None else instrument
+
+def graph_counts(graph) -> Dict[str, int]:
+    # nodes and edges of any of the graphs the builders return
+    if hasattr(graph, "num_edges"):
+        return {"nodes": graph.num_nodes, "edges": graph.num_edges}
+    if isinstance(graph, list):
+        # create_deBruijn_graph_by_string_comp: one node per k-mer
+        return {"nodes": len(graph), "edges": sum(len(node.m_outgoing) for node in graph)}
+    nodes = set(graph)
+    edges = 0
+    for successors in graph.values():
+        nodes.update(successors)
+        edges += len(successors)
+    return {"nodes": len(nodes), "edges": edges}
@@ -0,0 +1,127 @@
+'''
+NumPy de Bruijn graph over arrays of packed k-mer codes.
+
+The k-mers are held as one uint64 array (so k <= 32). Prefix and suffix codes
+for every k-mer are computed in a single vectorized pass, the (k-1)-mer nodes
+are numbered by their rank among the sorted unique codes, and the edges are
+stored in CSR form: the targets of node i are
+targets[offsets[i]:offsets[i+1]].
+'''
+
+from collections import defaultdict, deque
+from typing import List, Tuple
+
+import numpy as np
+
+from debruijn_graph import GraphValidation
+from kmer_codec import BYTE_CODE, encode_kmers, kmer_mask, spell_path
+
+MAX_K = 32
+
+def encode_kmer_array(kmers: List[str]) -> np.ndarray:
+    # encode equal-length k-mer strings into a uint64 array in one pass
+    n = len(kmers)
+    if n == 0:
+        return np.zeros(0, dtype=np.uint64)
+    k = len(kmers[0])
+    if k > MAX_K:
+        raise ValueError(f"k-mer array codes need k <= {MAX_K}, got {k}")
+    raw = np.frombuffer("".join(kmers).encode("ascii"), dtype=np.uint8)
+    if raw.size != n * k:
+        raise ValueError(f"all k-mers must have length {k}")
+    bases = BYTE_CODE[raw].reshape(n, k)
+    if (bases == 255).any():
+        raise ValueError("k-mers may only contain a, c, g and t")
+    codes = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        codes <<= np.uint64(2)
+        codes |= bases[:, j]
+    return codes
+
+class CSRGraph:
+    def __init__(self, k, node_codes, offsets, targets, in_degree, out_degree):
+        self.k = k
+        self.node_codes = node_codes
+        self.offsets = offsets
+        self.targets = targets
+        self.in_degree = in_degree
+        self.out_degree = out_degree
+        self._validation = None
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_codes)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.targets)
+
+    def validate(self) -> GraphValidation:
+        # classify every node by in-degree minus out-degree in one pass
+        if self._validation is None:
+            balance = self.in_degree - self.out_degree
+            sources = np.flatnonzero(balance == -1)
+            sinks = np.flatnonzero(balance == 1)
+            unbalanced = int(np.count_nonzero(balance))
+            self._validation = GraphValidation(
+                self.num_nodes - unbalanced, len(sources), len(sinks),
+                unbalanced - len(sources) - len(sinks),
+                int(sources[0]) if len(sources) else None,
+                int(sinks[0]) if len(sinks) else None)
+        return self._validation
+
+    def balance_count(self) -> dict:
+        # node index -> in-degree minus out-degree, unbalanced nodes only,
+        # the layout balanceCount returns
+        balance = self.in_degree - self.out_degree
+        nodes = np.flatnonzero(balance)
+        return dict(zip(nodes.tolist(), balance[nodes].tolist()))
+
+    def to_adjacency(self):
+        # dict of deques keyed by node index, the layout eulPath expects
+        graph = defaultdict(deque)
+        offsets = self.offsets.tolist()
+        targets = self.targets.tolist()
+        for i in np.flatnonzero(self.out_degree).tolist():
+            graph[i] = deque(targets[offsets[i]:offsets[i+1]])
+        return graph
+
+    def spell(self, path) -> str:
+        # genome spelled by a path of node indices
+        idx = np.fromiter(path, dtype=np.int64, count=len(path))
+        return spell_path(self.node_codes[idx], self.k)
+
+def pack_kmers(kmers: List[str]) -> Tuple[object, int]:
+    # (codes, k): a uint64 array for k <= MAX_K, Python ints beyond that
+    kmers = list(kmers)
+    k = len(kmers[0]) if kmers else 1
+    if k <= MAX_K:
+        return encode_kmer_array(kmers), k
+    return encode_kmers(kmers)
+
+def debrujin_graph_from_kmer_array(codes: np.ndarray, k: int) -> CSRGraph:
+    if k > MAX_K:
+        raise ValueError(f"k-mer array codes need k <= {MAX_K}, got {k}")
+    codes = np.asarray(codes, dtype=np.uint64)
+    prefixes = codes >> np.uint64(2)
+    suffixes = codes & np.uint64(kmer_mask(k - 1))
+    # one sort numbers the nodes and maps every endpoint to its node index
+    ends = np.concatenate((prefixes, suffixes))
+    order = np.argsort(ends)
+    ends = ends[order]
+    is_new = np.empty(len(ends), dtype=bool)
+    is_new[:1] = True
+    np.not_equal(ends[1:], ends[:-1], out=is_new[1:])
+    node_codes = ends[is_new]
+    n = len(node_codes)
+    inverse = np.empty(len(ends), dtype=np.int64)
+    inverse[order] = np.cumsum(is_new) - 1
+    src = inverse[:len(codes)]
+    dst = inverse[len(codes):]
+    order = np.argsort(src, kind="stable")
+    targets = dst[order]
+    out_degree = np.bincount(src, minlength=n)
+    in_degree = np.bincount(dst, minlength=n)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(out_degree, out=offsets[1:])
+    return CSRGraph(k, node_codes, offsets, targets, in_degree, out_degree)
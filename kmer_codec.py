@@ -0,0 +1,197 @@
+'''
+2-bit packed k-mer codes.
+
+Every nucleotide is stored in 2 bits (a=0, c=1, g=2, t=3) with the first base
+in the most significant position, so a whole k-mer is a single integer and its
+(k-1)-mer prefix and suffix are just a shift and a mask away. Codes for
+k <= 32 fit in a uint64; Python ints grow automatically for larger k, so the
+same functions work for any k.
+'''
+
+import io
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+NUCLEOTIDES = "acgt"
+
+# 2-bit code -> ascii byte of the base
+BASE_CHAR = np.frombuffer(NUCLEOTIDES.encode("ascii"), dtype=np.uint8)
+
+# ascii byte -> 2-bit code, 255 for anything that is not a nucleotide
+BYTE_CODE = np.full(256, 255, dtype=np.uint8)
+for _i, _base in enumerate(NUCLEOTIDES):
+    BYTE_CODE[ord(_base)] = _i
+    BYTE_CODE[ord(_base.upper())] = _i
+
+_BASE_CODE = {"a": 0, "c": 1, "g": 2, "t": 3,
+              "A": 0, "C": 1, "G": 2, "T": 3}
+
+def encode(seq: str) -> int:
+    code = 0
+    for base in seq:
+        code = (code << 2) | _BASE_CODE[base]
+    return code
+
+def decode(code: int, k: int) -> str:
+    bases = [""] * k
+    for i in range(k - 1, -1, -1):
+        bases[i] = NUCLEOTIDES[code & 3]
+        code >>= 2
+    return "".join(bases)
+
+def decode_codes(codes: np.ndarray, length: int) -> List[str]:
+    # packed codes of equal length to strings, in one vectorized pass
+    codes = np.asarray(codes, dtype=np.uint64)
+    if length == 0:
+        return [""] * len(codes)
+    shifts = np.arange(2 * (length - 1), -1, -2, dtype=np.uint64)
+    bases = ((codes[:, None] >> shifts) & np.uint64(3)).astype(np.intp)
+    text = BASE_CHAR[bases].tobytes().decode("ascii")
+    return [text[i:i+length] for i in range(0, len(text), length)]
+
+def kmer_mask(k: int) -> int:
+    return (1 << (2 * k)) - 1
+
+_MASK64 = (1 << 64) - 1
+# (shift, mask) steps that reverse the order of the 2-bit groups of a word
+_REVERSE_STEPS = ((2, 0x3333333333333333), (4, 0x0F0F0F0F0F0F0F0F),
+                  (8, 0x00FF00FF00FF00FF), (16, 0x0000FFFF0000FFFF),
+                  (32, 0x00000000FFFFFFFF))
+
+def revcomp_code(code: int, k: int) -> int:
+    # complementing is a xor with 3 per base (a<->t, c<->g); for k <= 32 the
+    # bases are reversed with swaps of ever larger bit groups of a 64-bit word
+    if k > 32:
+        rc = 0
+        for _ in range(k):
+            rc = (rc << 2) | (3 - (code & 3))
+            code >>= 2
+        return rc
+    x = ~code & _MASK64
+    for shift, mask in _REVERSE_STEPS:
+        x = ((x >> shift) & mask) | ((x & mask) << shift)
+    return x >> (64 - 2 * k)
+
+def revcomp_codes(codes: np.ndarray, k: int) -> np.ndarray:
+    # revcomp_code over a uint64 array, k <= 32
+    x = ~np.asarray(codes, dtype=np.uint64)
+    for shift, mask in _REVERSE_STEPS:
+        s, m = np.uint64(shift), np.uint64(mask)
+        x = ((x >> s) & m) | ((x & m) << s)
+    return x >> np.uint64(64 - 2 * k)
+
+def canonical_code(code: int, k: int) -> int:
+    # the smaller of a k-mer and its reverse complement; with a<c<g<t this
+    # is also the lexicographically smaller string
+    rc = revcomp_code(code, k)
+    return code if code <= rc else rc
+
+_COMPLEMENT = str.maketrans("acgtACGT", "tgcaTGCA")
+
+def reverse_complement(seq: str) -> str:
+    return seq.translate(_COMPLEMENT)[::-1]
+
+def encode_kmers(kmers: Iterable[str]) -> Tuple[List[int], int]:
+    # all k-mers must share the same k; returns (codes, k)
+    codes = []
+    k = 0
+    for kmer in kmers:
+        if k == 0:
+            k = len(kmer)
+        elif len(kmer) != k:
+            raise ValueError(f"k-mer {kmer} does not have length {k}")
+        codes.append(encode(kmer))
+    return codes, k
+
+def iter_kmers(seq: str, k: int) -> Iterator[str]:
+    # same k-mers as get_kmers(seq, k, False) without building the list
+    for i in range(len(seq) - k + 1):
+        yield seq[i:i+k]
+
+def iter_kmer_codes(seq: str, k: int) -> Iterator[int]:
+    # rolling 2-bit update: one shift, or and mask per position.
+    # Windows containing a base other than a/c/g/t (e.g. n) are skipped.
+    mask = kmer_mask(k)
+    code = 0
+    filled = 0
+    for base in seq:
+        b = _BASE_CODE.get(base)
+        if b is None:
+            code = 0
+            filled = 0
+            continue
+        code = ((code << 2) | b) & mask
+        filled += 1
+        if filled >= k:
+            yield code
+
+def shuffle_batches(stream: Iterable, batch_size: int = 1 << 16, seed=None) -> Iterator:
+    # shuffles within consecutive batches so only batch_size items are held
+    rng = np.random.default_rng(seed)
+    batch = []
+    for item in stream:
+        batch.append(item)
+        if len(batch) == batch_size:
+            for i in rng.permutation(batch_size):
+                yield batch[i]
+            batch = []
+    for i in rng.permutation(len(batch)):
+        yield batch[i]
+
+def iter_path_chunks(path: Iterable, k: Optional[int] = None,
+                     chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    # genome spelled by a path in ascii chunks of at most chunk_size
+    # nodes: the whole first node, then the last base of every other node.
+    # Nodes are strings, or packed (k-1)-mer codes when k is given.
+    if isinstance(path, np.ndarray):
+        # node codes already in an array: decode each chunk in bulk
+        if len(path) == 0:
+            return
+        yield decode(int(path[0]), k - 1).encode("ascii")
+        for start in range(1, len(path), chunk_size):
+            codes = path[start:start+chunk_size] & np.uint64(3)
+            yield BASE_CHAR[codes.astype(np.intp)].tobytes()
+        return
+    it = iter(path)
+    first = next(it, None)
+    if first is None:
+        return
+    if k is None:
+        yield first.encode("ascii")
+    else:
+        yield decode(first, k - 1).encode("ascii")
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        if k is None:
+            yield "".join([node[-1] for node in chunk]).encode("ascii")
+        elif k <= 33:
+            codes = np.fromiter(chunk, dtype=np.uint64, count=len(chunk))
+            yield BASE_CHAR[(codes & np.uint64(3)).astype(np.intp)].tobytes()
+        else:
+            yield "".join([NUCLEOTIDES[node & 3] for node in chunk]).encode("ascii")
+
+def spell_path(path, k: Optional[int] = None) -> str:
+    # fills one preallocated buffer instead of growing a string per node
+    if len(path) == 0:
+        return ""
+    node_len = len(path[0]) if k is None else k - 1
+    buf = bytearray(len(path) + node_len - 1)
+    pos = 0
+    for chunk in iter_path_chunks(path, k):
+        buf[pos:pos+len(chunk)] = chunk
+        pos += len(chunk)
+    return buf.decode("ascii")
+
+def write_path(path: Iterable, fh, k: Optional[int] = None,
+               chunk_size: int = 1 << 16) -> int:
+    # streams the spelled genome to fh (text or binary), returns its length
+    binary = not isinstance(fh, io.TextIOBase)
+    written = 0
+    for chunk in iter_path_chunks(path, k, chunk_size):
+        fh.write(chunk if binary else chunk.decode("ascii"))
+        written += len(chunk)
+    return written
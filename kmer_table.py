@@ -0,0 +1,146 @@
+'''
+Open-addressing hash table from packed (k-1)-mer codes to node ids.
+
+Keys and values live in two flat NumPy arrays (uint64 codes, int64 node ids,
+-1 marking an empty slot), so indexing tens of millions of nodes costs 16
+bytes per slot and no Python object per entry. Slots are picked by the
+splitmix64 finalizer, which is a bijection on 64-bit integers, and collisions
+are resolved by linear probing. insert_many/lookup_many work on whole arrays:
+every round probes all pending keys at once and only the keys that still
+collide go on to the next slot.
+
+Codes must fit in 64 bits, i.e. (k-1)-mers with k - 1 <= 32.
+'''
+
+from typing import List
+
+import numpy as np
+
+from kmer_codec import encode
+
+_M1 = np.uint64(0xbf58476d1ce4e5b9)
+_M2 = np.uint64(0x94d049bb133111eb)
+_MASK64 = (1 << 64) - 1
+
+def mix64(x: int) -> int:
+    # splitmix64 finalizer on one 64-bit int; a bijection with mix64(0) == 0
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return x ^ (x >> 31)
+
+def mix64_array(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer; uint64 arithmetic wraps around as intended
+    x = np.asarray(x, dtype=np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * _M1
+    x = (x ^ (x >> np.uint64(27))) * _M2
+    return x ^ (x >> np.uint64(31))
+
+class KmerTable:
+    def __init__(self, capacity: int = 1024, max_load: float = 0.5):
+        size = 1
+        while size * max_load < max(capacity, 1):
+            size <<= 1
+        self.max_load = max_load
+        self.keys = np.zeros(size, dtype=np.uint64)
+        self.values = np.full(size, -1, dtype=np.int64)
+        self.num_keys = 0
+        self.next_id = 0
+
+    def __len__(self) -> int:
+        return self.num_keys
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) >= 0
+
+    def __getitem__(self, key) -> int:
+        node_id = self.get(key)
+        if node_id < 0:
+            raise KeyError(key)
+        return node_id
+
+    def get(self, key) -> int:
+        # node id of one key (a code or a nucleotide string), -1 if absent
+        code = encode(key) if isinstance(key, str) else key
+        return int(self.lookup_many(np.array([code], dtype=np.uint64))[0])
+
+    def find(self, key) -> List[int]:
+        # the node ids of key as a list, empty if absent
+        node_id = self.get(key)
+        return [node_id] if node_id >= 0 else []
+
+    def insert(self, key, node_id: int) -> None:
+        # a key keeps the first node id it was inserted with
+        code = encode(key) if isinstance(key, str) else key
+        if self.get(code) >= 0:
+            return
+        self._reserve(1)
+        self._place(np.array([code], dtype=np.uint64), np.array([node_id], dtype=np.int64))
+        self.next_id = max(self.next_id, node_id + 1)
+
+    def lookup_many(self, codes: np.ndarray) -> np.ndarray:
+        codes = np.asarray(codes, dtype=np.uint64)
+        mask = np.uint64(len(self.keys) - 1)
+        result = np.full(len(codes), -1, dtype=np.int64)
+        pending = np.arange(len(codes))
+        slots = mix64_array(codes) & mask
+        while len(pending) > 0:
+            values = self.values[slots]
+            hit = (values >= 0) & (self.keys[slots] == codes[pending])
+            result[pending[hit]] = values[hit]
+            # keep probing where the slot is taken by another key
+            more = (values >= 0) & ~hit
+            pending = pending[more]
+            slots = (slots[more] + np.uint64(1)) & mask
+        return result
+
+    def insert_many(self, codes: np.ndarray) -> np.ndarray:
+        # node ids for every code; codes not yet in the table get new ids
+        # in order of their first occurrence
+        codes = np.asarray(codes, dtype=np.uint64)
+        ids = self.lookup_many(codes)
+        missing = np.flatnonzero(ids < 0)
+        if len(missing) > 0:
+            new_codes, first, inverse = np.unique(
+                codes[missing], return_index=True, return_inverse=True)
+            # rank of each new code by where it first appears
+            rank = np.empty(len(new_codes), dtype=np.int64)
+            rank[np.argsort(first)] = np.arange(len(new_codes))
+            new_ids = self.next_id + rank
+            self._reserve(len(new_codes))
+            self._place(new_codes, new_ids)
+            self.next_id += len(new_codes)
+            ids[missing] = new_ids[inverse]
+        return ids
+
+    def _reserve(self, extra: int) -> None:
+        if (self.num_keys + extra) <= self.max_load * len(self.keys):
+            return
+        used = self.values >= 0
+        old_keys = self.keys[used]
+        old_values = self.values[used]
+        size = len(self.keys)
+        while (self.num_keys + extra) > self.max_load * size:
+            size <<= 1
+        self.keys = np.zeros(size, dtype=np.uint64)
+        self.values = np.full(size, -1, dtype=np.int64)
+        self.num_keys = 0
+        self._place(old_keys, old_values)
+
+    def _place(self, codes: np.ndarray, node_ids: np.ndarray) -> None:
+        # codes must be distinct and absent from the table
+        mask = np.uint64(len(self.keys) - 1)
+        slots = mix64_array(codes) & mask
+        pending = np.arange(len(codes))
+        while len(pending) > 0:
+            free = self.values[slots] < 0
+            # of several keys aiming at the same free slot, the first wins
+            cand = np.flatnonzero(free)
+            _, winners = np.unique(slots[cand], return_index=True)
+            won = cand[winners]
+            self.keys[slots[won]] = codes[pending[won]]
+            self.values[slots[won]] = node_ids[pending[won]]
+            lost = np.ones(len(pending), dtype=bool)
+            lost[won] = False
+            pending = pending[lost]
+            slots = (slots[lost] + np.uint64(1)) & mask
+        self.num_keys += len(codes)
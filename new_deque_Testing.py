@@ -11,8 +11,27 @@ Created on Mon Mar 20 13:01:56 2023
 
 
 # importing dependencies ******************************************************
+import gzip
+import os
 import random
+import sys
+import tempfile
+import numpy as np
 from collections import defaultdict, deque
+from debruijn_graph import DeBruijnGraph, classify_balance, start_node
+from abundance import filter_kmers
+from canonical_graph import canonical_graph_from_kmers
+from contigs import assemble_contigs
+from instrumentation import graph_counts, instrumented
+from euler import eulerian_path
+from graph_export import compacted_unitigs, unitig_sequences
+from graph_store import load_graph, save_graph
+from incremental import IncrementalGraph
+from kmer_array import debrujin_graph_from_kmer_array, encode_kmer_array, MAX_K, pack_kmers
+from kmer_codec import encode, kmer_mask, reverse_complement, spell_path
+from seq_reader import read_kmers
+from synthetic import random_sequence, simulate_reads
+from unitigs import compact_graph, spell_unitig_path, unitig_eulerian_path
 
 '''
 Get to know deque:
@@ -34,25 +53,151 @@ debrujin_graph_from_kmers(patterns), and then finding the Eulerian path through
 the graph using the function eulPath(dict). Finally, the reconstructed genome
 sequence is obtained by concatenating the first k-1 characters of each k-mer in 
 the Eulerian path using the function genomePath(kmers).
+
+Before the traversal the graph is compacted (unitigs.compact_graph): every
+maximal non-branching path becomes one unitig carrying its spelled sequence,
+so the Eulerian path is found over the unitigs, whose number is typically
+orders of magnitude below the number of (k-1)-mers. Packed k-mers with
+k <= 32 skip the dict graph entirely: their nodes are integer ids in CSR
+arrays (kmer_array), and euler.eulerian_path folds the unitigs itself.
 '''
 
-def construct_sequence(patterns):
-    graph = debrujin_graph_from_kmers(patterns)
-    balanced_count = balanceCount(graph)
-    path = deque()
-    if has_Eulerian_path(balanced_count):
-        path = eulPath(graph,balanced_count)
+def construct_sequence(patterns, packed=False, k=None, output="genome", canonical=False,
+                       min_abundance=None, memory_bytes=1 << 26, instrument=None):
+    # packed=True builds the graph over 2-bit k-mer codes instead of strings;
+    # pass k as well when patterns already are codes, e.g. from
+    # read_kmers(path, k, packed=True).
+    # The graph is compacted into unitigs before the Eulerian traversal;
+    # output="unitigs" returns the unitig sequences instead of the genome,
+    # output="contigs" the contigs of every weakly connected component, which
+    # needs no Eulerian path (k <= 32).
+    # canonical=True treats the k-mers as coming from both strands, the
+    # genome is then spelled in whichever orientation the walk starts.
+    # min_abundance drops k-mers seen fewer times (sequencing errors) and
+    # keeps one copy of the rest; patterns are then read twice, so pass a
+    # list or a callable returning a fresh iterator.
+    # instrument (an instrumentation.Instrumentation) records every stage.
+    if output not in ("genome", "unitigs", "contigs"):
+        raise Exception(f"ERROR: unknown output mode {output}")
+    inst = instrumented(instrument)
+    with inst.capture():
+        return _construct_sequence(patterns, packed, k, output, canonical,
+                                   min_abundance, memory_bytes, inst)
+
+def _construct_sequence(patterns, packed, k, output, canonical, min_abundance,
+                        memory_bytes, inst):
+    if min_abundance is not None:
+        with inst.stage("filter") as info:
+            patterns = list(filter_kmers(patterns, min_abundance, memory_bytes,
+                                         k=k, canonical=canonical))
+            if inst.enabled:
+                info["solid_kmers"] = len(patterns)
+    if canonical:
+        if output != "genome":
+            raise Exception("ERROR: canonical k-mers only support genome output")
+        with inst.stage("build") as info:
+            graph = debrujin_graph_from_kmers(patterns, k, canonical=True)
+            if inst.enabled:
+                info["kmers"] = len(graph)
+                info["edges"] = graph.num_edges
+        with inst.stage("traverse") as info:
+            path = graph.eulerian_walk()
+            if inst.enabled:
+                info["path_nodes"] = len(path)
+        if not path:
+            return("No Eulerian Path Exists")
         print("Eulerian Path Exists")
-    else:
-        return("No Eulerian Path Exists")        
-    genome = genomePath(path)
-    return genome
+        with inst.stage("spell"):
+            return graph.spell(path)
+    if output == "contigs":
+        with inst.stage("build") as info:
+            if k is None:
+                patterns = list(patterns)
+                k = len(patterns[0]) if patterns else 1
+                codes = encode_kmer_array(patterns)
+            else:
+                codes = np.fromiter(patterns, dtype=np.uint64)
+            csr = debrujin_graph_from_kmer_array(codes, k)
+            if inst.enabled:
+                info.update(graph_counts(csr))
+        with inst.stage("contigs") as info:
+            contigs = assemble_contigs(csr)
+            if inst.enabled:
+                info["components"] = len(contigs)
+                info["contigs"] = sum(len(c) for c in contigs)
+        return contigs
+    if packed and k is None:
+        patterns, k = pack_kmers(patterns)
+    if k is not None and k <= MAX_K:
+        return _construct_from_codes(patterns, k, output, inst)
+    with inst.stage("build") as info:
+        graph = debrujin_graph_from_kmers(patterns, k)
+        if inst.enabled:
+            info.update(graph_counts(graph))
+    with inst.stage("compact") as info:
+        unitig_graph = compact_graph(graph, k)
+        if inst.enabled:
+            info["unitigs"] = len(unitig_graph)
+    if output == "unitigs":
+        return unitig_graph.unitigs
+    with inst.stage("balance") as info:
+        balanced_count = balanceCount(graph)
+        exists = has_Eulerian_path(balanced_count)
+        if inst.enabled:
+            info["unbalanced"] = len(balanced_count)
+    if not exists:
+        return("No Eulerian Path Exists")
+    with inst.stage("traverse") as info:
+        stats = {} if inst.enabled else None
+        path = unitig_eulerian_path(unitig_graph, stats)
+        if inst.enabled:
+            info["path_unitigs"] = len(path)
+            info.update(stats)
+    if not path:
+        return("No Eulerian Path Exists")
+    print("Eulerian Path Exists")
+    with inst.stage("spell"):
+        return spell_unitig_path(unitig_graph, path)
+
+def _construct_from_codes(codes, k, output, inst):
+    # packed k-mers with k <= MAX_K: integer node ids in CSR arrays, walked
+    # by euler.eulerian_path, which folds the unitigs itself
+    with inst.stage("build") as info:
+        csr = debrujin_graph_from_codes(codes, k)
+        if inst.enabled:
+            info.update(graph_counts(csr))
+    if output == "unitigs":
+        with inst.stage("compact") as info:
+            unitigs = unitig_sequences(compacted_unitigs(csr))
+            if inst.enabled:
+                info["unitigs"] = len(unitigs)
+        return unitigs
+    with inst.stage("balance") as info:
+        validation = csr.validate()
+        if inst.enabled:
+            info["unbalanced"] = csr.num_nodes - validation.num_balanced
+    if not validation.has_eulerian_path:
+        return("No Eulerian Path Exists")
+    with inst.stage("traverse") as info:
+        stats = {} if inst.enabled else None
+        try:
+            path = eulerian_path(csr, stats)
+        except Exception:
+            # the edges do not form one connected walk
+            return("No Eulerian Path Exists")
+        if inst.enabled:
+            info["path_nodes"] = len(path)
+            info.update(stats)
+    print("Eulerian Path Exists")
+    with inst.stage("spell"):
+        return csr.spell(path)
 
 '''
 The function debrujin_graph_from_kmers(patterns) constructs the De Bruijn graph
-by first generating all possible k-mers from the input list and then creating a 
-dictionary where each key is a k-mer and the corresponding value is a list of
-k-mers that overlap with the key by k-1 characters.
+in a single pass over the input k-mers, creating a dictionary where each key is
+a (k-1)-mer prefix and the corresponding value is a deque of the (k-1)-mer
+suffixes it overlaps by k-2 characters. Nodes come straight from the edges, so
+no separate suffix composition pass is needed.
 '''
 
 '''
@@ -71,22 +216,34 @@ creating a list of unnecessary strings.
 '''
 
 
-def debrujin_graph_from_kmers(patterns):
-    kmers = set()
-    for pattern in patterns:
-        kmers |= set(suffix_composition(len(pattern), pattern))
-    graph = defaultdict(deque)
-    for kmer in patterns:
-        graph[prefix(kmer)].append(suffix(kmer))
+def debrujin_graph_from_kmers(patterns, k=None, canonical=False):
+    # k is given when the patterns are packed k-mer codes; canonical=True
+    # stores each k-mer once for both strands in a bidirected graph
+    if canonical:
+        return canonical_graph_from_kmers(patterns, k)
+    if k is not None:
+        return debrujin_graph_from_codes(patterns, k)
+    graph = DeBruijnGraph()
+    graph.add_edges((prefix(kmer), suffix(kmer)) for kmer in patterns)
+    return graph
+
+def debrujin_graph_from_codes(codes, k):
+    # for k <= MAX_K the nodes are integer ids in CSR arrays (see
+    # kmer_array); wider codes go into the dict graph, where prefix is a
+    # shift and suffix is a mask, no string slicing
+    if k <= MAX_K:
+        if not isinstance(codes, np.ndarray):
+            codes = np.fromiter(codes, dtype=np.uint64)
+        return debrujin_graph_from_kmer_array(codes, k)
+    mask = kmer_mask(k - 1)
+    graph = DeBruijnGraph()
+    graph.add_edges((code >> 2, code & mask) for code in codes)
     return graph
 
-def genomePath(kmers, apppend_last=True):
-    genome = ''
-    for kmer in kmers:
-        genome += kmer[0]
-    if apppend_last:
-        genome += kmer[1:]
-    return genome
+def genomePath(kmers, apppend_last=True, k=None):
+    # k is given when the path holds packed (k-1)-mer codes
+    genome = spell_path(kmers, k)
+    return genome if apppend_last else genome[:len(kmers)]
 
 '''
 The function eulPath(dict) takes a dictionary representation of the 
@@ -110,20 +267,32 @@ a deque as a queue. Replace path.append() with path.appendleft() to add
  return path[::-1], as we will be using a deque to store the final path.
 '''
 
-def eulPath(graph, balanced_count):
+def eulPath(graph, balanced_count, stats=None):
+    # stats, if given, receives the number of dead ends the walk ran into
     dictionary = deque()
     #print("BALANCED COUNT ITEMS")
     #print(balanced_count.items())
-    dictionary.appendleft([k for k, v in balanced_count.items() if v == -1][0])
+    start = start_node(graph, balanced_count)
+    if start is None:
+        return deque()
+    dictionary.appendleft(start)
     path = deque()
+    dead_ends = 0
+    forward = False
     while dictionary:
         u_v = dictionary[0]
         try:
             w = graph[u_v][0]
             dictionary.appendleft(w)
             graph[u_v].popleft()
+            forward = True
         except:
+            if forward:
+                dead_ends += 1
+                forward = False
             path.appendleft(dictionary.popleft())
+    if stats is not None:
+        stats["dead_ends"] = dead_ends
     return path
 
 '''
@@ -142,6 +311,11 @@ def suffix_composition(k, text):
 '''
 
 def balanceCount(adjacentList):
+    # graphs from debrujin_graph_from_kmers count degrees as edges are added,
+    # so only their unbalanced nodes need to be handed back
+    if isinstance(adjacentList, DeBruijnGraph):
+        return adjacentList.balance
+
     # create a set of all nodes in the graph
     all_nodes = set(adjacentList.keys())
     #print(all_nodes)
@@ -153,18 +327,14 @@ def balanceCount(adjacentList):
     # create a dictionary to hold the balanced counts
     balanced_count = dict.fromkeys(all_nodes, 0)
     
-    if len(all_nodes) == 1:
-        #print("Single Node Exception")
-        for node in all_nodes:
-            balanced_count[node] = -1
-        return balanced_count
-
     # iterate over each node in the adjacency list
     for node in all_nodes:
         # subtract the out-degree of the node from its balanced count
-        balanced_count[node] -= len(adjacentList[node])
+        # get() so sink nodes are not inserted into a defaultdict
+        successors = adjacentList.get(node, ())
+        balanced_count[node] -= len(successors)
         # iterate over each outgoing edge from the node
-        for out in adjacentList[node]:
+        for out in successors:
             # add 1 to the balanced count of the node at the other end of the edge
             try:
                 balanced_count[out] += 1
@@ -179,8 +349,11 @@ def suffix(string):
 def prefix(string):
     return string[:-1]
     
-def get_kmers(seq, k, randomized=True):
+def get_kmers(seq, k, randomized=True, canonical=False):
     kmers = [seq[i:i+k] for i in range(len(seq) - k + 1)]
+    if canonical:
+        # each k-mer as the smaller of itself and its reverse complement
+        kmers = [min(kmer, reverse_complement(kmer)) for kmer in kmers]
     #print(kmers)
     if randomized:
         nkmers = len(kmers)
@@ -189,20 +362,129 @@ def get_kmers(seq, k, randomized=True):
             kmers[i], kmers[j] = kmers[j], kmers[i]
     return kmers
     
-def random_DNA_sequence(min_length=10, max_length=10000):
-    DNA = ""
-    length = random.randint(min_length, max_length)
-    nucleotides = "atgc"
-    for n in range(length):
-        DNA += nucleotides[random.randint(0, 3)]
-    return DNA
+def random_DNA_sequence(min_length=10, max_length=10000, seed=None):
+    # drawn with NumPy in one go; the same seed gives the same sequence
+    rng = np.random.default_rng(seed)
+    length = int(rng.integers(min_length, max_length + 1))
+    return random_sequence(length, rng=rng)
     
 def has_Eulerian_path(balanced_count):
-    for k, v in balanced_count.items():
-        if v == -1:
-            return True
-    return False    
+    # exactly one source and one sink, or all nodes balanced (a cycle)
+    return classify_balance(balanced_count).has_eulerian_path    
     
+def canonical_composition(seq, k):
+    return sorted(min(seq[i:i+k], reverse_complement(seq[i:i+k]))
+                  for i in range(len(seq) - k + 1))
+
+def test_canonical():
+    # k-mers in random orientation: even k, palindromic k-mers (catg,
+    # acgt, gaattc), k-mers repeated on the other strand (acat / atgt) and
+    # a genome whose ends are palindromic (k-1)-mers (at ... ta)
+    cases = [("acatgt", 4), ("acgtacgtacgt", 4), ("aattaattcgcg", 4), ("atatgtta", 3),
+             ("gaattcgaattc", 6), ("acgtttaaacgt", 6),
+             ("tgatgcagcatatctttaaatcggaaggattctaggaagtcgctagcgaacatcgacgcg", 4),
+             (random_DNA_sequence(50, 200, seed=8), 8),
+             (random_DNA_sequence(50, 200, seed=9), 9)]
+    rng = random.Random(0)
+    for seq, k in cases:
+        kmers = [kmer if rng.random() < 0.5 else reverse_complement(kmer)
+                 for kmer in get_kmers(seq, k, True)]
+        result = construct_sequence(kmers, canonical=True)
+        if canonical_composition(result, k) == canonical_composition(seq, k):
+            print(f"Passed canonical k={k} ({seq[:20]}...)")
+        else:
+            print(f"FAILED canonical k={k} ({seq[:20]}...): {result}")
+
+def contig_composition(contigs, k):
+    # sorted k-mers of a list of components, each a list of contigs
+    return sorted(contig[i:i+k] for component in contigs for contig in component
+                  for i in range(len(contig) - k + 1))
+
+def test_incremental():
+    # batches added and removed, every step checked against an assembly of
+    # the current k-mers from scratch
+    k = 12
+    seqs = [random_DNA_sequence(300, 600, seed=s) for s in (1, 2, 3)]
+    batches = [get_kmers(seq, k, True) for seq in seqs]
+    graph = IncrementalGraph()
+    current = []
+    steps = [("add", 0), ("add", 1), ("add", 2), ("remove", 1), ("add", 1), ("remove", 0)]
+    for action, i in steps:
+        if action == "add":
+            graph.add_kmers(batches[i])
+            current += batches[i]
+        else:
+            graph.remove_kmers(batches[i])
+            for kmer in batches[i]:
+                current.remove(kmer)
+        contigs = graph.assemble()
+        fresh = construct_sequence(current, output="contigs")
+        if (contig_composition(contigs, k) == sorted(current)
+                and len(contigs) == len(fresh)
+                and sum(map(len, contigs)) == sum(map(len, fresh))):
+            print(f"Passed incremental {action} batch {i}")
+        else:
+            print(f"FAILED incremental {action} batch {i}")
+
+def test_graph_store():
+    # save/load round trip of a CSR graph, then a walk over the mapped file
+    seq = random_DNA_sequence(2000, 2000, seed=4)
+    k = 21
+    codes, _ = pack_kmers(get_kmers(seq, k, True))
+    graph = debrujin_graph_from_kmer_array(codes, k)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "graph.dbg")
+        save_graph(graph, path)
+        loaded = load_graph(path)
+        same = loaded.k == k and all(
+            np.array_equal(getattr(graph, name), getattr(loaded, name))
+            for name in ("node_codes", "offsets", "targets", "in_degree", "out_degree"))
+        seq_loaded = loaded.spell(eulerian_path(loaded))
+        del loaded
+    if same and seq_loaded == seq:
+        print("Passed graph save/load round trip")
+    else:
+        print("FAILED graph save/load round trip")
+
+def test_abundance_filter():
+    # noisy reads: the error k-mers are seen once or twice, the genome's
+    # k-mers about 20 times, so the filtered graph spells the genome
+    seq = random_DNA_sequence(3000, 3000, seed=5)
+    k = 21
+    reads = simulate_reads(seq, 100, coverage=30, error_rate=0.005, seed=6)
+    kmers = [read[i:i+k] for read in reads for i in range(len(read) - k + 1)]
+    result = construct_sequence(kmers, min_abundance=3)
+    if result in seq and len(result) >= 0.95 * len(seq):
+        print(f"Passed abundance filter ({len(result)} of {len(seq)} bases)")
+    else:
+        print(f"FAILED abundance filter: {result[:40]}")
+
+def test_read_files():
+    # multi-line FASTA with an n, and gzip-compressed FASTQ, read as k-mers
+    # and as packed codes
+    k = 7
+    seqs = [random_DNA_sequence(50, 80, seed=s) for s in (7, 8)]
+    seqs[0] = seqs[0][:20] + "n" + seqs[0][21:]
+    expected = [seq[i:i+k] for seq in seqs for i in range(len(seq) - k + 1)
+                if "n" not in seq[i:i+k]]
+    with tempfile.TemporaryDirectory() as tmp:
+        fasta = os.path.join(tmp, "reads.fa")
+        with open(fasta, "w") as fh:
+            for i, seq in enumerate(seqs):
+                fh.write(f">read{i}\n{seq[:30].upper()}\n{seq[30:]}\n")
+        fastq = os.path.join(tmp, "reads.fq.gz")
+        with gzip.open(fastq, "wt") as fh:
+            for i, seq in enumerate(seqs):
+                fh.write(f"@read{i}\n{seq}\n+\n{'I' * len(seq)}\n")
+        for path in (fasta, fastq):
+            kmers = list(read_kmers(path, k))
+            codes = list(read_kmers(path, k, packed=True))
+            name = os.path.basename(path)
+            if kmers == expected and codes == [encode(kmer) for kmer in expected]:
+                print(f"Passed reading {name}")
+            else:
+                print(f"FAILED reading {name}")
+
 def main():
     seq_truths = ["aaaaaaaaaaa", "agcagctcagc", "agcagctcag", random_DNA_sequence(11, 15)]
     
@@ -211,10 +493,20 @@ def main():
         kmers = get_kmers(i,3,True)
         print(kmers)
         print(construct_sequence(kmers))
+    test_canonical()
+    test_incremental()
+    test_graph_store()
+    test_abundance_filter()
+    test_read_files()
 
 if __name__ == "__main__":
-    main()
-    #data = "".join(open('./text1.txt')).split()
-    #print(data)
-    #print(data[1:])
-    #print(construct_sequence(data[1:]))
\ No newline at end of file
+    if len(sys.argv) > 1:
+        # python new_deque_Testing.py reads.fa[.gz] k
+        # (k can be left out for a file with one k-mer per line)
+        k = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        if k is None:
+            print(construct_sequence(read_kmers(sys.argv[1])))
+        else:
+            print(construct_sequence(read_kmers(sys.argv[1], k, packed=True), packed=True, k=k))
+    else:
+        main()
\ No newline at end of file
@@ -1,8 +1,18 @@
 import random
 import time
+import numpy as np
 from typing import List
 from typing import Tuple
 from collections import defaultdict, deque
+from debruijn_graph import DeBruijnGraph, classify_balance, start_node
+from kmer_codec import kmer_mask, spell_path, iter_kmer_codes, shuffle_batches
+from composition import composition_difference
+from synthetic import random_sequence
+from kmer_array import CSRGraph, encode_kmer_array, debrujin_graph_from_kmer_array, MAX_K, pack_kmers
+from euler import eulerian_path
+from parallel_build import debrujin_graph_parallel
+from contigs import assemble_contigs
+from instrumentation import graph_counts, instrumented
 
 def main():
     test_seq_assembly()
@@ -13,11 +23,20 @@ def test_and_print_message(seq, seq_truth, k, message):
     elif compare_composition(seq, seq_truth, k):
         print(f"Passed {message} (assembled a sequence of the same composition with the original sequence). Congratulations!")
     else:
-        print("FAILED test 1!")
+        diff = composition_difference(seq, seq_truth, k)
+        if diff is None:
+            print("FAILED test 1!")
+        else:
+            print(f"FAILED test 1! First differing k-mer: {diff.kmer} "
+                  f"(assembled {diff.count1}, expected {diff.count2})")
 
-def test_1(method):
+def test_1(method, seed=None):
+    # a seed makes the sequence and the k-mer shuffle, and so the timings,
+    # reproducible
     print(f"Testing k-assembler by {method}")
-    seqs_truth = ["aaaaaaaaaaa","agcagctcagc","agcagctcagg",random_DNA_sequence(10000, 20000)]
+    if seed is not None:
+        random.seed(seed)
+    seqs_truth = ["aaaaaaaaaaa","agcagctcagc","agcagctcagg",random_DNA_sequence(10000, 20000, seed)]
     ks = [5, 3, 3, 20]
     for i in range(len(seqs_truth)):     
         print(f"\nExample {i}:")
@@ -25,11 +44,23 @@ def test_1(method):
         #print(curr)
         k = ks[i]
         kmers = get_kmers(curr, k, True)
+        packed_k = None
+        csr = None
+        if method == "packed k-mer hashing":
+            kmers, packed_k = pack_kmers(kmers)
+        elif method in ("k-mer array", "parallel k-mer array"):
+            kmers = encode_kmer_array(kmers)
         begin = time.time()
         if method == "k-mer pairwise comparison":
             create_deBruijn_graph_by_string_comp(kmers)
         elif method == "k-mer hashing":
             g = debrujin_graph_from_kmers(kmers)
+        elif method == "packed k-mer hashing":
+            g = debrujin_graph_from_kmers(kmers, packed_k)
+        elif method == "k-mer array":
+            csr = debrujin_graph_from_kmer_array(kmers, k)
+        elif method == "parallel k-mer array":
+            csr = debrujin_graph_parallel(kmers, k)
         elif method == "k-mer hashing without deque":
             g = debrujin_graph_from_kmers_nondeque(kmers)
         else:
@@ -38,8 +69,24 @@ def test_1(method):
         elapsed_secs = end - begin
         print(f"Elapsed time for building de Bruijn graph: {elapsed_secs}")
 
+        if csr is not None:
+            if csr.validate().has_eulerian_path:
+                print("Passed test for existence of Eulerian path. Congratulations!")
+            else:
+                print("Failed test for existence of Eulerian path!")
+                continue
+            try:
+                begin = time.time()
+                path = eulerian_path(csr)
+                end = time.time()
+                print(f"Elapsed time for building Eulerian path: {end - begin}")
+                seq = csr.spell(path)
+                message = f"Test 1 Example {i}"
+                test_and_print_message(seq, curr, k, message)
+            except Exception as e:
+                print(f"ERROR: {e}")
         # Euler Path was not implemented for the data structure given by the pairwise method
-        if(method != "k-mer pairwise comparison"):
+        elif(method != "k-mer pairwise comparison"):
             balanced_count = balanceCount(g)
             #print("BALANCED COUNT")
             #print(balanced_count)
@@ -50,21 +97,31 @@ def test_1(method):
                 print("Failed test for existence of Eulerian path!")
                 continue
             try:
+                begin = time.time()
                 path = eulPath(g,balanced_count)
-                seq = genomePath(path)
+                end = time.time()
+                print(f"Elapsed time for building Eulerian path: {end - begin}")
+                seq = genomePath(path, k=packed_k)
                 message = f"Test 1 Example {i}"
                 test_and_print_message(seq, curr, k, message)
             except Exception as e:
                 print(f"ERROR: {e}")
 
-def test_2(method):
-    seq_truth = random_DNA_sequence()
+def test_2(method, seed=None):
+    if seed is not None:
+        random.seed(seed)
+    seq_truth = random_DNA_sequence(seed=seed)
     k = 10
-    kmers = get_kmers(seq_truth, k)
     # Euler Path was not implemented for the data structure given by the pairwise method
     if(method != "k-mer pairwise comparison"):
         try:
-            seq = assemble_kmers(kmers, method)
+            if method == "packed k-mer hashing":
+                # stream the codes straight into the graph, no k-mer list
+                kmers = shuffle_batches(iter_kmer_codes(seq_truth, k))
+                seq = assemble_kmers(kmers, method, k)
+            else:
+                kmers = get_kmers(seq_truth, k)
+                seq = assemble_kmers(kmers, method)
             test_and_print_message(seq, seq_truth, k, "Test 2")
         except Exception as e:
             print(e)
@@ -83,47 +140,123 @@ def test_3(method):
     except Exception as e:
         print(e)
 
-def test_seq_assembly():
+def test_seq_assembly(seed=None):
     methods = [
         "k-mer pairwise comparison",
         "k-mer hashing",
-        "k-mer hashing without deque"
+        "k-mer hashing without deque",
+        "packed k-mer hashing",
+        "k-mer array",
+        "parallel k-mer array"
     ]
     for method in methods:   
         print("-----------")
-        test_1(method)
+        test_1(method, seed)
         print()
-        test_2(method)
+        test_2(method, seed)
         print()
     print("-----------")
     test_3("k-mer hashing")
 
-def assemble_kmers(kmers, method):
+def assemble_kmers(kmers, method, k=None, mode="path", instrument=None):
+    # k is given when kmers is already a stream of packed codes.
+    # mode="contigs" does not need an Eulerian path: it returns the contigs
+    # of every weakly connected component, built on the k-mer array graph
+    # ("parallel k-mer array" uses the parallel builder).
+    # instrument (an instrumentation.Instrumentation) records every stage
+    inst = instrumented(instrument)
+    with inst.capture():
+        return _assemble_kmers(kmers, method, k, mode, inst)
+
+def _assemble_kmers(kmers, method, k, mode, inst):
     seq = ""
+    packed_k = k
+    if mode not in ("path", "contigs"):
+        raise Exception(f"ERROR: unknown assembly mode {mode}")
+    if mode == "contigs":
+        with inst.stage("build") as info:
+            if k is None:
+                kmers = list(kmers)
+                k = len(kmers[0])
+                kmers = encode_kmer_array(kmers)
+            else:
+                kmers = np.fromiter(kmers, dtype=np.uint64)
+            if method == "parallel k-mer array":
+                csr = debrujin_graph_parallel(kmers, k)
+            else:
+                csr = debrujin_graph_from_kmer_array(kmers, k)
+            if inst.enabled:
+                info.update(graph_counts(csr))
+        with inst.stage("contigs") as info:
+            contigs = assemble_contigs(csr)
+            if inst.enabled:
+                info["components"] = len(contigs)
+                info["contigs"] = sum(len(c) for c in contigs)
+        return contigs
+    with inst.stage("build") as info:
+        if method == "k-mer pairwise comparison":
+            g = create_deBruijn_graph_by_string_comp(kmers)
+        elif method == "k-mer hashing":
+            g = debrujin_graph_from_kmers(kmers)
+        elif method == "packed k-mer hashing":
+            codes = kmers
+            if packed_k is None:
+                codes, packed_k = pack_kmers(kmers)
+            g = debrujin_graph_from_kmers(codes, packed_k)
+        elif method in ("k-mer array", "parallel k-mer array"):
+            if k is None:
+                k = len(kmers[0])
+                kmers = encode_kmer_array(kmers)
+            if method == "k-mer array":
+                g = debrujin_graph_from_kmer_array(kmers, k)
+            else:
+                g = debrujin_graph_parallel(kmers, k)
+        elif method == "k-mer hashing without deque":
+            g = debrujin_graph_from_kmers_nondeque(kmers)
+        else:
+            raise Exception("ERROR: unknown methods!")
+        if inst.enabled:
+            info.update(graph_counts(g))
     if method == "k-mer pairwise comparison":
-        create_deBruijn_graph_by_string_comp(kmers)
-    elif method == "k-mer hashing":
-        g = debrujin_graph_from_kmers(kmers)
-    elif method == "k-mer hashing without deque":
-        g = debrujin_graph_from_kmers_nondeque(kmers)
-    else:
-        raise Exception("ERROR: unknown methods!")
-    balanced_count = balanceCount(g)
+        # Euler Path was not implemented for the data structure given by the pairwise method
+        raise Exception("ERROR: Eulerian path is not implemented for the pairwise method!")
+    if method in ("k-mer array", "parallel k-mer array"):
+        with inst.stage("balance"):
+            exists = g.validate().has_eulerian_path
+        if not exists:
+            raise Exception("ERROR: Eulerian path does not exist!")
+        with inst.stage("traverse") as info:
+            stats = {} if inst.enabled else None
+            path = eulerian_path(g, stats)
+            if inst.enabled:
+                info["path_nodes"] = len(path)
+                info.update(stats)
+        with inst.stage("spell"):
+            return g.spell(path)
+    with inst.stage("balance") as info:
+        balanced_count = balanceCount(g)
+        exists = has_Eulerian_path(balanced_count)
+        if inst.enabled:
+            info["unbalanced"] = sum(1 for b in balanced_count.values() if b)
     #path = deque()
-    if not has_Eulerian_path(balanced_count):
+    if not exists:
         raise Exception("ERROR: Eulerian path does not exist!")
     else:
-        path = eulPath(g,balanced_count)
-        seq = genomePath(path)
+        with inst.stage("traverse") as info:
+            stats = {} if inst.enabled else None
+            path = eulPath(g,balanced_count,stats)
+            if inst.enabled:
+                info["path_nodes"] = len(path)
+                info.update(stats)
+        with inst.stage("spell"):
+            seq = genomePath(path, k=packed_k)
     return seq
 
-def random_DNA_sequence(min_length=10, max_length=10000):
-    DNA = ""
-    length = random.randint(min_length, max_length)
-    nucleotides = "atgc"
-    for n in range(length):
-        DNA += nucleotides[random.randint(0, 3)]
-    return DNA
+def random_DNA_sequence(min_length=10, max_length=10000, seed=None):
+    # drawn with NumPy in one go; the same seed gives the same sequence
+    rng = np.random.default_rng(seed)
+    length = int(rng.integers(min_length, max_length + 1))
+    return random_sequence(length, rng=rng)
 
 def get_kmers(seq, k, randomized=True):
     kmers = [seq[i:i+k] for i in range(len(seq) - k + 1)]
@@ -135,46 +268,46 @@ def get_kmers(seq, k, randomized=True):
     return kmers
 
 def compare_composition(s1, s2, k):
-    same_composition = True
-    if len(s1) != len(s2):
-        same_composition = False
-    elif s1 == s2:
-        same_composition = True
-    else:
-        composition1 = get_kmers(s1, k)
-        composition1.sort()
-        composition2 = get_kmers(s2, k)
-        composition2.sort()
-        same_composition = composition1 == composition2
-    return same_composition
+    # packed k-mer arrays compared by np.sort, see composition.py
+    return len(s1) == len(s2) and composition_difference(s1, s2, k) is None
 
-def genomePath(kmers, apppend_last=True):
-    genome = ''
-    for kmer in kmers:
-        genome += kmer[0]
-    if apppend_last:
-        genome += kmer[1:]
-    return genome
+def genomePath(kmers, apppend_last=True, k=None):
+    # k is given when the path holds packed (k-1)-mer codes
+    genome = spell_path(kmers, k)
+    return genome if apppend_last else genome[:len(kmers)]
 
-def debrujin_graph_from_kmers(patterns):
-    kmers = set()
-    for pattern in patterns:
-        kmers = set(suffix_composition(len(pattern), pattern))
-    graph = defaultdict(deque)
-    for kmer in patterns:
-        graph[prefix(kmer)].append(suffix(kmer))
+def debrujin_graph_from_kmers(patterns, k=None):
+    # k is given when the patterns are packed k-mer codes
+    if k is not None:
+        return debrujin_graph_from_codes(patterns, k)
+    graph = DeBruijnGraph()
+    graph.add_edges((prefix(kmer), suffix(kmer)) for kmer in patterns)
+    return graph
+
+def debrujin_graph_from_codes(codes, k):
+    # for k <= MAX_K the nodes are integer ids in CSR arrays (see
+    # kmer_array); wider codes go into the dict graph, where prefix is a
+    # shift and suffix is a mask, no string slicing
+    if k <= MAX_K:
+        if not isinstance(codes, np.ndarray):
+            codes = np.fromiter(codes, dtype=np.uint64)
+        return debrujin_graph_from_kmer_array(codes, k)
+    mask = kmer_mask(k - 1)
+    graph = DeBruijnGraph()
+    graph.add_edges((code >> 2, code & mask) for code in codes)
     return graph
 
 def debrujin_graph_from_kmers_nondeque(patterns):
-    kmers = []
-    for pattern in patterns:
-        kmers = kmers + suffix_composition(len(pattern), pattern)
-    kmers = set(kmers)
     dict = {}
-    for kmer1 in kmers:
-        dict[kmer1] = deque()
+    # register both endpoints of every edge as it is added, one pass
     for kmer in patterns:
-        dict[prefix(kmer)].append(suffix(kmer))
+        pre = prefix(kmer)
+        suf = suffix(kmer)
+        if pre not in dict:
+            dict[pre] = deque()
+        if suf not in dict:
+            dict[suf] = deque()
+        dict[pre].append(suf)
     return dict
 
 class Node:
@@ -184,19 +317,21 @@ class Node:
         self.m_outgoing = []
 
 def create_deBruijn_graph_by_string_comp(kmers):
+    # same k-mer overlap nodes as comparing every pair of k-mers, but the
+    # matches are looked up by (k-1)-mer instead of scanned for
+    by_prefix = defaultdict(list)
+    suffix_count = defaultdict(int)
+    for kmer in kmers:
+        if len(kmer) > 1:
+            by_prefix[kmer[:-1]].append(kmer)
+            suffix_count[kmer[1:]] += 1
     nodes = []
-    nodesFound = []
-    i = 0
     for kmerNode in kmers:
-        nodesFound.append(kmerNode)
-        nodes.append(Node(kmerNode))
-        for kmerCompare in kmers:
-            if len(kmerNode) > 1 and len(kmerCompare) > 1:
-                if kmerNode[:-1] == kmerCompare[1:]:
-                    nodes[i].m_num_of_incoming += 1
-                if kmerNode[1:] == kmerCompare[:-1]:
-                    nodes[i].m_outgoing.append(kmerCompare)
-        i += 1
+        node = Node(kmerNode)
+        if len(kmerNode) > 1:
+            node.m_num_of_incoming = suffix_count.get(kmerNode[:-1], 0)
+            node.m_outgoing = list(by_prefix.get(kmerNode[1:], ()))
+        nodes.append(node)
     return nodes
 
 def suffix_composition(k, text):
@@ -212,6 +347,13 @@ def prefix(string):
     return string[:-1]
 
 def balanceCount(adjacentList):
+    # graphs from debrujin_graph_from_kmers count degrees as edges are added,
+    # so only their unbalanced nodes need to be handed back
+    if isinstance(adjacentList, DeBruijnGraph):
+        return adjacentList.balance
+    if isinstance(adjacentList, CSRGraph):
+        return adjacentList.balance_count()
+
     # create a set of all nodes in the graph
     all_nodes = set(adjacentList.keys())
     #print(all_nodes)
@@ -235,36 +377,45 @@ def balanceCount(adjacentList):
                 balanced_count[out] = 1
     return balanced_count
 
-def build_sequence(path):
-    seq1 = ''.join(path)
-    seq2 = ''
-    for i in range(0, len(seq1)):
-        if (i % 2) == 0:
-            seq2 += seq1[i]
-    seq2 += seq1[len(seq1)-1]
-    return seq2
+def build_sequence(path, k=None):
+    # first node in full, then the last base of each following node
+    return spell_path(path, k)
 
-def eulPath(graph, balanced_count):
+def eulPath(graph, balanced_count, stats=None):
+    # stats, if given, receives the number of dead ends the walk ran into.
+    # A CSRGraph is walked by euler.eulerian_path and the path comes back
+    # as (k-1)-mer codes, which genomePath spells with k.
+    if isinstance(graph, CSRGraph):
+        return graph.node_codes[np.frombuffer(eulerian_path(graph, stats), dtype=np.uint32)]
     dictionary = deque()
     #print("BALANCED COUNT ITEMS")
     #print(balanced_count.items())
-    dictionary.appendleft([k for k, v in balanced_count.items() if v == -1][0])
+    start = start_node(graph, balanced_count)
+    if start is None:
+        return deque()
+    dictionary.appendleft(start)
     path = deque()
+    dead_ends = 0
+    forward = False
     while dictionary:
         u_v = dictionary[0]
         try:
             w = graph[u_v][0]
             dictionary.appendleft(w)
             graph[u_v].popleft()
+            forward = True
         except:
+            if forward:
+                dead_ends += 1
+                forward = False
             path.appendleft(dictionary.popleft())
+    if stats is not None:
+        stats["dead_ends"] = dead_ends
     return path
 
 def has_Eulerian_path(balanced_count):
-    for k, v in balanced_count.items():
-        if v == -1:
-            return True
-    return False    
+    # exactly one source and one sink, or all nodes balanced (a cycle)
+    return classify_balance(balanced_count).has_eulerian_path    
 
 
 if __name__ == "__main__":
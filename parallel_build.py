@@ -0,0 +1,141 @@
+'''
+Sharded multi-process de Bruijn graph construction.
+
+The k-mer codes are split into shards by a hash of their (k-1)-mer prefix, so
+every node's outgoing edges land in exactly one shard. The codes, node codes
+and edge targets live in shared memory and the worker processes of a
+ProcessPoolExecutor operate on their shard's slice in place:
+
+  phase 1: sort the shard's k-mers (which sorts its edges by prefix) and
+           count the out-degree of each distinct prefix;
+  phase 2: once the parent has laid out the node codes of all shards, map
+           every suffix to a global node id, looking it up in the shard its
+           hash points to.
+
+Node ids are assigned shard by shard, followed by the nodes that only ever
+appear as a suffix. The merged result is an ordinary CSRGraph, so it can be
+walked with euler.eulerian_path or, via to_adjacency, with eulPath.
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from kmer_array import CSRGraph, MAX_K
+from kmer_codec import kmer_mask
+from kmer_table import mix64_array
+
+def shard_of(codes: np.ndarray, num_shards: int) -> np.ndarray:
+    return (mix64_array(codes) % np.uint64(num_shards)).astype(np.intp)
+
+def _sort_shard(codes_name, n, begin, end):
+    # phase 1: returns the shard's distinct prefixes and their out-degrees
+    shm = shared_memory.SharedMemory(name=codes_name)
+    try:
+        return _sort_slice(np.ndarray((n,), dtype=np.uint64, buffer=shm.buf)[begin:end])
+    finally:
+        shm.close()
+
+def _sort_slice(shard):
+    shard.sort()
+    return np.unique(shard >> np.uint64(2), return_counts=True)
+
+def _map_targets(codes_name, n, nodes_name, node_bounds, targets_name, k, begin, end):
+    # phase 2: global node id of every suffix in the shard, -1 when the
+    # suffix is never a prefix; returns how many of those there were
+    shm_c = shared_memory.SharedMemory(name=codes_name)
+    shm_n = shared_memory.SharedMemory(name=nodes_name)
+    shm_t = shared_memory.SharedMemory(name=targets_name)
+    try:
+        return _map_slice(
+            np.ndarray((n,), dtype=np.uint64, buffer=shm_c.buf)[begin:end],
+            np.ndarray((node_bounds[-1],), dtype=np.uint64, buffer=shm_n.buf),
+            node_bounds,
+            np.ndarray((n,), dtype=np.int64, buffer=shm_t.buf)[begin:end], k)
+    finally:
+        shm_c.close()
+        shm_n.close()
+        shm_t.close()
+
+def _map_slice(codes, nodes, node_bounds, targets, k):
+    suffixes = codes & np.uint64(kmer_mask(k - 1))
+    owner = shard_of(suffixes, len(node_bounds) - 1)
+    targets[:] = -1
+    for s in np.unique(owner).tolist():
+        lo, hi = node_bounds[s], node_bounds[s + 1]
+        sel = np.flatnonzero(owner == s)
+        pos = np.searchsorted(nodes[lo:hi], suffixes[sel])
+        found = pos < hi - lo
+        found[found] = nodes[lo:hi][pos[found]] == suffixes[sel[found]]
+        targets[sel[found]] = lo + pos[found]
+    return int(np.count_nonzero(targets < 0))
+
+def _create_shared(shms, nbytes):
+    shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    shms.append(shm)
+    return shm
+
+def debrujin_graph_parallel(codes: np.ndarray, k: int, workers=None) -> CSRGraph:
+    if k > MAX_K:
+        raise ValueError(f"k-mer array codes need k <= {MAX_K}, got {k}")
+    workers = workers or os.cpu_count() or 1
+    codes = np.asarray(codes, dtype=np.uint64)
+    n = len(codes)
+    num_shards = workers
+    # group the k-mers by the shard of their prefix
+    shard = shard_of(codes >> np.uint64(2), num_shards)
+    if num_shards <= 1 << 16:
+        # on 16-bit keys the stable sort is a radix (counting) sort, O(n)
+        # instead of a comparison sort of all n codes in the parent
+        shard = shard.astype(np.uint16)
+    order = np.argsort(shard, kind="stable")
+    bounds = np.zeros(num_shards + 1, dtype=np.int64)
+    np.cumsum(np.bincount(shard, minlength=num_shards), out=bounds[1:])
+    del shard
+    shms = []
+    try:
+        shm_codes = _create_shared(shms, codes.nbytes)
+        np.ndarray((n,), dtype=np.uint64, buffer=shm_codes.buf)[:] = codes[order]
+        del order
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            phase1 = [pool.submit(_sort_shard, shm_codes.name, n,
+                                  int(bounds[s]), int(bounds[s + 1]))
+                      for s in range(num_shards)]
+            results = [f.result() for f in phase1]
+            prefix_nodes = np.concatenate([nodes for nodes, _ in results])
+            out_degree = np.concatenate([deg for _, deg in results])
+            node_bounds = [0]
+            for nodes, _ in results:
+                node_bounds.append(node_bounds[-1] + len(nodes))
+            del results
+            shm_nodes = _create_shared(shms, prefix_nodes.nbytes)
+            np.ndarray(prefix_nodes.shape, dtype=np.uint64, buffer=shm_nodes.buf)[:] = prefix_nodes
+            shm_targets = _create_shared(shms, n * 8)
+            phase2 = [pool.submit(_map_targets, shm_codes.name, n, shm_nodes.name,
+                                  node_bounds, shm_targets.name, k,
+                                  int(bounds[s]), int(bounds[s + 1]))
+                      for s in range(num_shards)]
+            num_unmapped = sum(f.result() for f in phase2)
+        targets = np.ndarray((n,), dtype=np.int64, buffer=shm_targets.buf).copy()
+        # nodes that are only ever a suffix go after all the prefix nodes
+        sink_nodes = np.zeros(0, dtype=np.uint64)
+        if num_unmapped:
+            unmapped = np.flatnonzero(targets < 0)
+            sorted_codes = np.ndarray((n,), dtype=np.uint64, buffer=shm_codes.buf)
+            suffixes = sorted_codes[unmapped] & np.uint64(kmer_mask(k - 1))
+            del sorted_codes
+            sink_nodes, inverse = np.unique(suffixes, return_inverse=True)
+            targets[unmapped] = len(prefix_nodes) + inverse
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+    node_codes = np.concatenate((prefix_nodes, sink_nodes))
+    num_nodes = len(node_codes)
+    out_degree = np.concatenate((out_degree, np.zeros(len(sink_nodes), dtype=out_degree.dtype)))
+    in_degree = np.bincount(targets, minlength=num_nodes)
+    offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(out_degree, out=offsets[1:])
+    return CSRGraph(k, node_codes, offsets, targets, in_degree, out_degree)
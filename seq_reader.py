@@ -0,0 +1,150 @@
+'''
+Streaming k-mer reader for FASTA, FASTQ and k-mer-per-line files.
+
+Files (optionally gzip compressed) are read in fixed-size blocks and split
+into lines as memoryview slices of the block, so nothing is read line by line
+and no per-line copies are made before the bases are consumed. Sequence lines
+are turned into k-mers on the fly, carrying the last k-1 bases across line
+and block boundaries, so a record never has to be held in memory as a whole
+and files larger than RAM can be fed straight into construct_sequence or
+assemble_kmers.
+
+K-mers containing anything other than a/c/g/t (e.g. n) are skipped. Bases
+are lower-cased to match the rest of the assembler.
+'''
+
+import gzip
+import re
+from typing import Iterator, Optional
+
+from kmer_codec import BYTE_CODE
+
+FASTA = "fasta"
+FASTQ = "fastq"
+KMERS = "kmers"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_NON_ACGT = re.compile(r"[^acgt]+")
+
+# kmer_codec.BYTE_CODE as a list, which the per-byte loop indexes faster
+_BYTE_CODE = BYTE_CODE.tolist()
+
+def open_reads(path):
+    # binary handle on path, transparently decompressing gzip
+    fh = open(path, "rb")
+    if fh.peek(2)[:2] == _GZIP_MAGIC:
+        fh.close()
+        return gzip.open(path, "rb")
+    return fh
+
+def iter_lines(fh, block_size: int = 1 << 20) -> Iterator[memoryview]:
+    # lines without their line terminator, as slices of the block read
+    leftover = b""
+    while True:
+        block = fh.read(block_size)
+        if not block:
+            break
+        data = leftover + block if leftover else block
+        view = memoryview(data)
+        pos = 0
+        while True:
+            nl = data.find(b"\n", pos)
+            if nl < 0:
+                break
+            end = nl - 1 if nl > pos and data[nl-1] == 13 else nl
+            yield view[pos:end]
+            pos = nl + 1
+        leftover = data[pos:]
+    if leftover:
+        yield memoryview(leftover.rstrip(b"\r"))
+
+def iter_sequence_chunks(lines, fmt: Optional[str] = None) -> Iterator:
+    # (chunk, new_record) pairs, chunk holding bases only; the format is
+    # guessed from the first non-empty line when not given
+    new_record = True
+    line_no = 0
+    for line in lines:
+        if len(line) == 0:
+            continue
+        if fmt is None:
+            fmt = detect_format(line)
+        if fmt == FASTA:
+            if line[0] == 62:
+                new_record = True
+                continue
+            yield line, new_record
+            new_record = False
+        elif fmt == FASTQ:
+            # header, sequence, '+', quality
+            if line_no % 4 == 1:
+                yield line, True
+            line_no += 1
+        elif fmt == KMERS:
+            yield line, True
+        else:
+            raise ValueError(f"unknown read format {fmt}")
+
+def _kmers_from_chunks(chunks, k: int) -> Iterator[str]:
+    carry = ""
+    for chunk, new_record in chunks:
+        if new_record:
+            carry = ""
+        seq = carry + str(chunk, "ascii").lower()
+        pieces = _NON_ACGT.split(seq)
+        for piece in pieces:
+            for i in range(len(piece) - k + 1):
+                yield piece[i:i+k]
+        carry = pieces[-1][-(k-1):] if k > 1 else ""
+
+def _codes_from_chunks(chunks, k: int) -> Iterator[int]:
+    # rolling 2-bit update carried across chunks of the same record
+    mask = (1 << (2 * k)) - 1
+    code = 0
+    filled = 0
+    for chunk, new_record in chunks:
+        if new_record:
+            code = 0
+            filled = 0
+        for byte in chunk:
+            b = _BYTE_CODE[byte]
+            if b == 255:
+                code = 0
+                filled = 0
+                continue
+            code = ((code << 2) | b) & mask
+            filled += 1
+            if filled >= k:
+                yield code
+
+def detect_format(line) -> str:
+    return {62: FASTA, 64: FASTQ}.get(line[0], KMERS)
+
+def read_kmers(source, k: Optional[int] = None, fmt: Optional[str] = None,
+               packed: bool = False, block_size: int = 1 << 20) -> Iterator:
+    # k-mers of every record in source (a path or a binary file object).
+    # For k-mer-per-line files the lines are the k-mers and k may be left
+    # out; FASTA and FASTQ need k. packed=True yields 2-bit codes.
+    fh = open_reads(source) if not hasattr(source, "read") else source
+    try:
+        lines = iter_lines(fh, block_size)
+        first = next((line for line in lines if len(line) > 0), None)
+        if first is None:
+            return
+        if fmt is None:
+            fmt = detect_format(first)
+        if k is None:
+            if fmt != KMERS:
+                raise ValueError("k is required for FASTA and FASTQ input")
+            k = len(first)
+        chunks = iter_sequence_chunks(_prepend(first, lines), fmt)
+        if packed:
+            yield from _codes_from_chunks(chunks, k)
+        else:
+            yield from _kmers_from_chunks(chunks, k)
+    finally:
+        if fh is not source:
+            fh.close()
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
@@ -0,0 +1,108 @@
+'''
+Synthetic test data: random genomes, k-mer arrays and simulated reads.
+
+Everything is drawn with a NumPy Generator into uint8 base-code arrays
+(a=0, c=1, g=2, t=3) and only turned into ascii bytes at the end, so a
+100 Mbp genome takes seconds instead of the minutes the character-by-
+character string building needed. Every function takes a seed (or an
+existing Generator as rng) so benchmark inputs are reproducible.
+
+  random_sequence   i.i.d. bases with a given GC content
+  synthetic_genome  random_sequence plus copies of random repeat units
+  kmer_array        packed codes of all k-mers of a sequence, shuffled
+  simulate_reads    reads at random positions (optionally from both
+                    strands) with substitution errors
+'''
+
+from typing import List, Optional
+
+import numpy as np
+
+from kmer_array import MAX_K
+from kmer_codec import BASE_CHAR, BYTE_CODE
+
+def make_rng(seed=None, rng: Optional[np.random.Generator] = None) -> np.random.Generator:
+    return rng if rng is not None else np.random.default_rng(seed)
+
+def random_codes(length: int, gc_content: float = 0.5, seed=None, rng=None) -> np.ndarray:
+    # uint8 base codes; c and g each with probability gc_content / 2
+    if not 0.0 <= gc_content <= 1.0:
+        raise ValueError(f"gc_content must be between 0 and 1, got {gc_content}")
+    rng = make_rng(seed, rng)
+    at = (1.0 - gc_content) / 2
+    cumulative = np.array([at, 0.5, 0.5 + gc_content / 2])
+    return np.searchsorted(cumulative, rng.random(length), side="right").astype(np.uint8)
+
+def to_sequence(codes: np.ndarray) -> str:
+    return BASE_CHAR[codes].tobytes().decode("ascii")
+
+def to_codes(seq: str) -> np.ndarray:
+    codes = BYTE_CODE[np.frombuffer(seq.encode("ascii"), dtype=np.uint8)]
+    if (codes == 255).any():
+        raise ValueError("sequence may only contain a, c, g and t")
+    return codes
+
+def random_sequence(length: int, gc_content: float = 0.5, seed=None, rng=None) -> str:
+    return to_sequence(random_codes(length, gc_content, seed, rng))
+
+def synthetic_genome(length: int, gc_content: float = 0.5, repeats: int = 0,
+                     repeat_length: int = 500, repeat_copies: int = 2,
+                     seed=None, rng=None) -> str:
+    # random genome with `repeats` random units of repeat_length, each
+    # written over repeat_copies random positions
+    rng = make_rng(seed, rng)
+    codes = random_codes(length, gc_content, rng=rng)
+    if repeats > 0 and repeat_length <= length:
+        for _ in range(repeats):
+            unit = random_codes(repeat_length, gc_content, rng=rng)
+            for pos in rng.integers(0, length - repeat_length + 1, size=repeat_copies).tolist():
+                codes[pos:pos+repeat_length] = unit
+    return to_sequence(codes)
+
+def kmer_array(seq, k: int, shuffle: bool = True, seed=None, rng=None) -> np.ndarray:
+    # uint64 codes of every k-mer of seq (a string or base codes), in random
+    # order unless shuffle=False
+    if k > MAX_K:
+        raise ValueError(f"k-mer array codes need k <= {MAX_K}, got {k}")
+    codes = to_codes(seq) if isinstance(seq, str) else np.asarray(seq, dtype=np.uint8)
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    kmers = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        kmers <<= np.uint64(2)
+        kmers |= codes[j:j+n]
+    if shuffle:
+        make_rng(seed, rng).shuffle(kmers)
+    return kmers
+
+def simulate_reads(seq, read_length: int = 100, num_reads: Optional[int] = None,
+                   coverage: float = 10.0, error_rate: float = 0.0,
+                   both_strands: bool = False, seed=None, rng=None,
+                   batch_size: int = 1 << 16) -> List[str]:
+    # reads of read_length from uniform random positions; num_reads defaults
+    # to enough for the given coverage. Each base is replaced by one of the
+    # other three with probability error_rate, and with both_strands half of
+    # the reads are reverse complemented.
+    rng = make_rng(seed, rng)
+    codes = to_codes(seq) if isinstance(seq, str) else np.asarray(seq, dtype=np.uint8)
+    if read_length > len(codes):
+        raise ValueError(f"read_length {read_length} exceeds the sequence length {len(codes)}")
+    if num_reads is None:
+        num_reads = int(np.ceil(coverage * len(codes) / read_length))
+    offsets = np.arange(read_length)
+    reads = []
+    for begin in range(0, num_reads, batch_size):
+        m = min(batch_size, num_reads - begin)
+        starts = rng.integers(0, len(codes) - read_length + 1, size=m)
+        batch = codes[starts[:, None] + offsets]
+        if error_rate > 0:
+            errors = rng.random(batch.shape) < error_rate
+            shift = rng.integers(1, 4, size=int(errors.sum()), dtype=np.uint8)
+            batch[errors] = (batch[errors] + shift) & 3
+        if both_strands:
+            flip = rng.random(m) < 0.5
+            batch[flip] = 3 - batch[flip][:, ::-1]
+        text = BASE_CHAR[batch].tobytes().decode("ascii")
+        reads.extend(text[i:i+read_length] for i in range(0, m * read_length, read_length))
+    return reads
@@ -1,14 +1,23 @@
 # TODO: ADD IN CODE TO SKELETON
-# (TASK 1) DNAHasher: lineno 316
-# (TASK 2) debrujin_graph_from_kmers: lineno 355
-# (TASK 3) eulPath: lineno 208
+# (TASK 1) DNAHasher: lineno 312
+# (TASK 2) debrujin_graph_from_kmers: lineno 399
+# (TASK 3) find_Eulerian_path: lineno 463
 
 # all imports
 import time
 import random
 from typing import List
 from typing import Tuple
-from collections import defaultdict, deque
+
+import numpy as np
+from debruijn_graph import GraphValidation
+from euler import eulerian_start, hierholzer_edges
+from kmer_array import encode_kmer_array, debrujin_graph_from_kmer_array, MAX_K
+from kmer_codec import decode, encode, kmer_mask, spell_path
+from kmer_table import KmerTable, mix64
+from composition import composition_difference
+from graph_export import write_dot
+from synthetic import random_sequence
 
 def main():
     test_seq_assembly();
@@ -17,14 +26,85 @@ def main():
 # test.cpp
 
 class Node:
-    def __init__(self, label):
-        self.label = label
-        self.outgoing = []
-        self.num_of_incoming = 0
+    # view of one node of a DiGraph; nothing is stored per node
+    __slots__ = ("graph", "index")
+
+    def __init__(self, graph, index: int):
+        self.graph = graph
+        self.index = index
+
+    @property
+    def label(self) -> str:
+        return decode(int(self.graph.label_codes[self.index]), self.graph.k - 1)
+
+    @property
+    def outgoing(self) -> List[int]:
+        return self.graph.successors(self.index).tolist()
+
+    @property
+    def num_of_incoming(self) -> int:
+        return int(self.graph.in_degree[self.index])
+
+class NodeList:
+    # g.nodes: a sequence of Node views over the graph arrays
+    __slots__ = ("graph",)
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __len__(self) -> int:
+        return len(self.graph.label_codes)
+
+    def __getitem__(self, i: int) -> Node:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return Node(self.graph, i)
+
+    def __iter__(self):
+        graph = self.graph
+        return (Node(graph, i) for i in range(len(self)))
 
 class DiGraph:
+    # struct of arrays: packed (k-1)-mer label, in-degree and CSR outgoing
+    # edges (targets[offsets[i]:offsets[i+1]]) of every node. The labels are
+    # uint64 codes, so the builders below take k <= MAX_K (32).
     def __init__(self):
-        self.nodes = []
+        self.k = 1
+        self.label_codes = np.zeros(0, dtype=np.uint64)
+        self.in_degree = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.targets = np.zeros(0, dtype=np.int64)
+        # set by validate_graph: node classification with source/sink ids
+        self.validation = None
+
+    @property
+    def nodes(self) -> NodeList:
+        return NodeList(self)
+
+    @property
+    def out_degree(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def successors(self, i: int) -> np.ndarray:
+        return self.targets[self.offsets[i]:self.offsets[i+1]]
+
+    def set_edges(self, k: int, label_codes, src, dst) -> None:
+        # replaces the graph; edges keep their input order per node
+        n = len(label_codes)
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        self.k = k
+        self.label_codes = np.asarray(label_codes, dtype=np.uint64)
+        self.targets = dst[np.argsort(src, kind="stable")]
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.offsets[1:])
+        self.in_degree = np.bincount(dst, minlength=n)
+        self.validation = None
+
+    def labels(self) -> List[str]:
+        return [decode(code, self.k - 1) for code in self.label_codes.tolist()]
 
 def test_and_print_message(seq, seq_truth, k, message):
     if seq == seq_truth:
@@ -32,15 +112,24 @@ def test_and_print_message(seq, seq_truth, k, message):
     elif compare_composition(seq, seq_truth, k):
         print(f"Passed {message} (assembled a sequence of the same composition with the original sequence). Congratulations!")
     else:
-        print("FAILED test 1!")
+        diff = composition_difference(seq, seq_truth, k)
+        if diff is None:
+            print("FAILED test 1!")
+        else:
+            print(f"FAILED test 1! First differing k-mer: {diff.kmer} "
+                  f"(assembled {diff.count1}, expected {diff.count2})")
 
-def test_1(method):
+def test_1(method, seed=None):
+    # a seed makes the sequence and the k-mer shuffle, and so the timings,
+    # reproducible
     print(f"Testing k-assembler by {method}")
+    if seed is not None:
+        random.seed(seed)
     seqs_truth = [
         "aaaaaaaaaaa",
         "agcagctcagc",
         "agcagctcagg",
-        random_DNA_sequence(10000, 20000)
+        random_DNA_sequence(10000, 20000, seed)
     ]
     ks = [5, 3, 3, 20]
     for i in range(len(seqs_truth)):     
@@ -71,8 +160,10 @@ def test_1(method):
         except Exception as e:
             print(f"ERROR: {e}")
 
-def test_2(method):
-    seq_truth = random_DNA_sequence()
+def test_2(method, seed=None):
+    if seed is not None:
+        random.seed(seed)
+    seq_truth = random_DNA_sequence(seed=seed)
     k = 10
     kmers = get_kmers(seq_truth, k)
     try:
@@ -95,16 +186,16 @@ def test_3(method):
     except Exception as e:
         print(e)
 
-def test_seq_assembly():
+def test_seq_assembly(seed=None):
     methods = [
         "k-mer pairwise comparison",
         "k-mer hashing"
     ]
     for method in methods:   
         print("-----------")
-        test_1(method)
+        test_1(method, seed)
         print()
-        test_2(method)
+        test_2(method, seed)
         print()
     print("-----------")
     test_3("k-mer hashing")
@@ -114,13 +205,11 @@ def test_seq_assembly():
 ###############################################################################
 # sequence.cpp
 
-def random_DNA_sequence(min_length=10, max_length=10000) -> str:
-    DNA = ""
-    length = random.randint(min_length, max_length)
-    nucleotides = "atgc"
-    for n in range(length):
-        DNA += nucleotides[random.randint(0, 3)]
-    return DNA
+def random_DNA_sequence(min_length=10, max_length=10000, seed=None) -> str:
+    # drawn with NumPy in one go; the same seed gives the same sequence
+    rng = np.random.default_rng(seed)
+    length = int(rng.integers(min_length, max_length + 1))
+    return random_sequence(length, rng=rng)
 
 def get_kmers(seq: str, k: int, randomized=True) -> List[str]:
     kmers = [seq[i:i+k] for i in range(len(seq) - k + 1)]
@@ -132,24 +221,16 @@ def get_kmers(seq: str, k: int, randomized=True) -> List[str]:
     return kmers
 
 def compare_composition(s1: str, s2: str, k: int) -> bool:
-    same_composition = True
-    if len(s1) != len(s2):
-        same_composition = False
-    elif s1 == s2:
-        same_composition = True
-    else:
-        composition1 = get_kmers(s1, k)
-        composition1.sort()
-        composition2 = get_kmers(s2, k)
-        composition2.sort()
-        same_composition = composition1 == composition2
-    return same_composition
+    # packed k-mer arrays compared by np.sort, see composition.py
+    return len(s1) == len(s2) and composition_difference(s1, s2, k) is None
 #################################################################
 
 #################################################################
 # k-assembler.cpp
 
-def assemble_kmers(kmers, method, dotfile=""):
+def assemble_kmers(kmers, method, dotfile="", circular=False):
+    # circular: the k-mers wrap around a circular genome (a plasmid, a
+    # mitochondrion), which is returned starting at an arbitrary position
     seq = ""
     g = DiGraph()
     if method == "k-mer pairwise comparison":
@@ -163,93 +244,89 @@ def assemble_kmers(kmers, method, dotfile=""):
     if not has_Eulerian_path(g):
         raise Exception("ERROR: Eulerian path does not exist!")
     else:
-        path = find_Eulerian_path(g)
+        path = find_Eulerian_path(g, "circuit" if circular else "path")
         seq = build_sequence(path, g)
+        if circular:
+            # the closed walk repeats its first k-1 bases at the end
+            seq = seq[:len(path) - 1]
     return seq
 
 def build_sequence(path, g):
-    nodes = g.nodes
-    k = len(nodes[path[0]].m_label) + 1
-    seq = [""] * (k - 1 + len(path) - 1)
-    seq[:k-1] = list(nodes[path[0]].m_label)
-    i = k - 1
-    for pos in path[1:]:
-        seq[i] = nodes[pos].m_label[-1]
-        i += 1
-    return "".join(seq)
+    # the path's label codes spelled in one go
+    return spell_path(g.label_codes[np.asarray(path, dtype=np.int64)], g.k)
 
 def printDOTFile(g, file):
-    with open(file, 'w') as ofs:
-        ofs.write("digraph {\n")
-        ofs.write("label=\"de Bruijn graph\"\n")
-        nodes = g.nodes
-        for node in nodes:
-            for to in node.outgoing:
-                prefix = node.m_label
-                suffix = nodes[to].m_label
-                ofs.write(f"{prefix}->{suffix} [label={prefix}{suffix[-1]}];\n")
-        ofs.write("}\n")
+    # streamed in batches by graph_export, see write_gfa there for GFA1
+    write_dot(g, file)
 
 ###########################################################################################################
 
 ##########################################################################################
 # DeBruijnByStringComp.cpp
 
+def _check_k(k: int) -> None:
+    # node labels are packed into uint64, see DiGraph
+    if k > MAX_K:
+        raise ValueError(f"DiGraph node labels need k <= {MAX_K}, got {k}")
+
 def create_deBruijn_graph_by_string_comp(kmers: List[str], g) -> None:
-    nodes = []
+    if len(kmers) > 0:
+        _check_k(len(kmers[0]))
+    labels = []
+    # label -> node id, replaces the linear scan over nodes
+    index = {}
+    src = []
+    dst = []
+    k = 1
     for kmer in kmers:
         k = len(kmer)
         prefix = kmer[:k-1]
-        i = 0
-        for node in nodes:
-            if node.label == prefix:
-                break
-            i += 1
-        else:
-            from_node = Node(prefix)
-            #from_node.m_label = prefix
-            from_node.m_num_of_incoming = 0
-            nodes.append(from_node)
-            i = len(nodes) - 1
-        from_node = nodes[i]
+        i = index.get(prefix)
+        if i is None:
+            i = len(labels)
+            index[prefix] = i
+            labels.append(prefix)
         suffix = kmer[1:k]
-        j = 0
-        for node in nodes:
-            if node.label == suffix:
-                break
-            j += 1
-        else:
-            to_node = Node(suffix)
-            #to_node.label = suffix
-            to_node.m_num_of_incoming = 0
-            nodes.append(to_node)
-            j = len(nodes) - 1
-        to_node = nodes[j]
-        from_node.outgoing.append(j)
-        to_node.m_num_of_incoming += 1
-    g.nodes = nodes
+        j = index.get(suffix)
+        if j is None:
+            j = len(labels)
+            index[suffix] = j
+            labels.append(suffix)
+        src.append(i)
+        dst.append(j)
+    label_codes = np.fromiter((encode(label) for label in labels),
+                              dtype=np.uint64, count=len(labels))
+    g.set_edges(k, label_codes, src, dst)
 
 ##########################################################################################
 
 ##########################################################################################
 # deBruijnByHash.cpp
 
-def genomePath(kmers, apppend_last=True):
-    genome = ''
-    for kmer in kmers:
-        genome += kmer[0]
-    if apppend_last:
-        genome += kmer[1:]
-    return genome
-
-#class DNAHasher:
-#    def __call__(self, seq: str) -> int:
-#        val = 0
-        # Write a DNA sequence hash function here
-        # BEGIN your code here:
-
-        # END your code above
-#        return val
+def genomePath(kmers, apppend_last=True, k=None):
+    # k is given when the path holds packed (k-1)-mer codes
+    genome = spell_path(kmers, k)
+    return genome if apppend_last else genome[:len(kmers)]
+
+class DNAHasher:
+    # 2 bits per base behind a leading 1 bit, so sequences of different length
+    # never share a code. Each 64-bit limb then goes through the invertible
+    # splitmix64 finalizer, chained with the limb before it, and a marker bit
+    # above the limbs records how many there were. Every step can be undone,
+    # so distinct sequences always hash to distinct values, for any k.
+    def __call__(self, seq: str) -> int:
+        val = 0
+        code = encode(seq) | (1 << (2 * len(seq)))
+        prev = 0
+        shift = 0
+        while code:
+            prev = mix64((code & 0xffffffffffffffff) ^ prev)
+            val |= prev << shift
+            code >>= 64
+            shift += 64
+        if shift > 64:
+            val |= 1 << shift
+        return val
 
 class AlphabetHasher:
     def __call__(self, seq: str) -> int:
@@ -260,33 +337,85 @@ class AlphabetHasher:
             val += ord(seq[i].lower()) - ord('a')
         return val
 
-class CSeqHash(defaultdict):
-    def __init__(self):
-        super().__init__(list)
-
-    def insert(self, key: str, node_id: int):
-        self[key].append(node_id)
-
-def create_hash_table(kmers: List[str]) -> CSeqHash:
-    ht = CSeqHash()
+class CSeqHash:
+    # (k-1)-mer -> node id, the same interface as kmer_table.KmerTable: a
+    # key keeps the first id it was inserted with. With a hasher (e.g.
+    # DNAHasher) the sequences are stored under their hash values, which is
+    # lossless when the hasher is collision free.
+    def __init__(self, hasher=None):
+        self.table = {}
+        self.hasher = hasher
+
+    def _key(self, key):
+        return key if self.hasher is None else self.hasher(key)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def __contains__(self, key) -> bool:
+        return self._key(key) in self.table
+
+    def __getitem__(self, key) -> int:
+        return self.table[self._key(key)]
+
+    def get(self, key) -> int:
+        # node id of key, -1 if absent
+        return self.table.get(self._key(key), -1)
+
+    def insert(self, key: str, node_id: int) -> None:
+        self.table.setdefault(self._key(key), node_id)
+
+    def find(self, key: str) -> List[int]:
+        node_id = self.get(key)
+        return [node_id] if node_id >= 0 else []
+
+def create_hash_table(kmers: List[str], backend="dict", hasher=None):
+    # backend "dict": CSeqHash, a dict entry per (k-1)-mer.
+    # backend "numpy": KmerTable over packed codes, no per-entry objects
+    # (needs k <= MAX_K). Both answer insert/find/get, `in` and [] alike.
+    if backend == "numpy":
+        k = len(kmers[0]) if len(kmers) else 1
+        _check_k(k)
+        codes = encode_kmer_array(kmers)
+        # prefix then suffix of every k-mer, the order node ids are given in
+        ends = np.empty(2 * len(codes), dtype=np.uint64)
+        ends[0::2] = codes >> np.uint64(2)
+        ends[1::2] = codes & np.uint64(kmer_mask(k - 1))
+        ht = KmerTable(len(ends))
+        ht.insert_many(ends)
+        return ht
+    if backend != "dict":
+        raise Exception(f"ERROR: unknown hash table backend {backend}!")
+    ht = CSeqHash(hasher)
     node_id = 0
     for kmer in kmers:
         for j in range(2):
-            key = kmer[j: len(kmer)-1]
+            key = kmer[j: len(kmer)-1+j]
             if key not in ht:
                 ht.insert(key, node_id)
                 node_id += 1
     return ht
   
-def debrujin_graph_from_kmers(patterns):
-    kmers = set()
-    for pattern in patterns:
-        kmers = set(suffix_composition(len(pattern), pattern))
-    graph = defaultdict(deque)
-    for kmer in patterns:
-        graph[prefix(kmer)].append(suffix(kmer))
-    return graph
-    
+def debrujin_graph_from_kmers(patterns, k=None):
+    # k is given when the patterns are packed k-mer codes; both go through
+    # the k-mer array builder and come back as a DiGraph
+    if k is None:
+        patterns = list(patterns)
+        k = len(patterns[0]) if patterns else 1
+        _check_k(k)
+        codes = encode_kmer_array(patterns)
+    else:
+        _check_k(k)
+        codes = np.fromiter(patterns, dtype=np.uint64)
+    csr = debrujin_graph_from_kmer_array(codes, k)
+    g = DiGraph()
+    g.k = k
+    g.label_codes = csr.node_codes
+    g.offsets = csr.offsets
+    g.targets = csr.targets
+    g.in_degree = csr.in_degree
+    return g
+
 def suffix_composition(k, text):
     kmers = []
     for i in range(len(text) + 1 - k):
@@ -304,92 +433,75 @@ def prefix(string):
 ###########################################################################################################
 # EulerPath.cpp
 
+def validate_graph(g) -> GraphValidation:
+    # classify every node from the degree arrays and cache the result
+    balance = g.in_degree - g.out_degree
+    sources = np.flatnonzero(balance == -1)
+    sinks = np.flatnonzero(balance == 1)
+    unbalanced = int(np.count_nonzero(balance))
+    g.validation = GraphValidation(
+        len(balance) - unbalanced, len(sources), len(sinks),
+        unbalanced - len(sources) - len(sinks),
+        int(sources[0]) if len(sources) else None,
+        int(sinks[0]) if len(sinks) else None)
+    return g.validation
+
+def graph_validation(g) -> GraphValidation:
+    # the cached validate_graph result; set_edges clears it
+    if g.validation is None:
+        validate_graph(g)
+    return g.validation
+
 def source(g) -> int:
-    for i in range(len(g.nodes)):
-        if len(g.nodes[i].outgoing) == g.nodes[i].m_num_of_incoming + 1:
-            return i
-    return len(g.nodes)
+    src = graph_validation(g).source
+    return len(g.nodes) if src is None else src
 
 def sink(g) -> int:
-    for i in range(len(g.nodes)):
-        if len(g.nodes[i].outgoing) + 1 == g.nodes[i].m_num_of_incoming:
-            return i
-    return len(g.nodes)
-
-
-def eulPath(graph):
-    stack = deque()
-    balanced_count = balanceCount(graph)
-    stack.appendleft([k for k, v in balanced_count.items() if v == -1][0])
-    path = deque()
-    while stack:
-        u_v = stack[0]
-        try:
-            w = graph[u_v][0]
-            stack.appendleft(w)
-            graph[u_v].popleft()
-        except:
-            path.appendleft(stack.popleft())
-    return path
-    
-def balanceCount(adjacentList):
-    balanced_count = defaultdict(int)
-    # Look for nodes balancing
-    for node in adjacentList.keys():
-        for out in adjacentList.nodes[node]:
-            balanced_count[node] -= 1
-            balanced_count[out] += 1
-    return balanced_count
-
-def find_Eulerian_path(g):
-    path = []
-    cycle = []
-    src = source(g)
-    dest = sink(g)
-    src = 0 if src >= len(g.nodes) else src
-    dest = 0 if dest >= len(g.nodes) else dest
-    nodes = g.nodes
-    nodes[dest].outgoing.append(src)
-    nodes[src].m_num_of_incoming += 1
-    cycle = eulPath(g)
-    pos_src, pos_dest = None, None
-    for pos_dest in range(len(cycle)):
-        if pos_dest != len(cycle) - 1:
-            pos_src = pos_dest + 1
-            if cycle[pos_src] == src and cycle[pos_dest] == dest:
-                break
-        else:
-            break
-    if pos_src is not None and pos_dest is not None:
-        path += cycle[pos_src:pos_dest+1]
-        path += cycle[:pos_src+1]
+    dest = graph_validation(g).sink
+    return len(g.nodes) if dest is None else dest
+
+def find_Eulerian_path(g, mode="path") -> np.ndarray:
+    # Eulerian walk over the DiGraph arrays as node ids. mode="path" accepts
+    # a graph with one source and one sink, or a balanced one (the walk is
+    # then closed); mode="circuit" requires a balanced graph, e.g. the graph
+    # of a circular genome, and returns a walk whose first and last node match.
+    if mode not in ("path", "circuit"):
+        raise Exception(f"ERROR: unknown mode {mode}!")
+    validation = graph_validation(g)
+    if mode == "circuit" and not validation.is_cycle:
+        raise Exception("ERROR: Eulerian circuit does not exist!")
+    if not validation.has_eulerian_path:
+        raise Exception("ERROR: Eulerian path does not exist!")
+    num_edges = len(g.targets)
+    if num_edges == 0:
+        return np.zeros(0, dtype=np.int64)
+    if validation.is_cycle:
+        start = eulerian_start(g.out_degree, g.in_degree)
+        edges = np.frombuffer(hierholzer_edges(g.offsets, g.targets, start), dtype=np.int64)
+        path = np.empty(len(edges) + 1, dtype=np.int64)
+        path[0] = start
+        path[1:] = g.targets[edges]
     else:
-        raise Exception("Searching for Eulerian path has failed!")
+        # close the path with an artificial edge dest -> src, stored first in
+        # dest's slice, and walk from dest: Hierholzer's circuit always starts
+        # with the first edge taken, so the artificial edge is edges[0] and
+        # its target src begins the path without any search or rotation
+        src = validation.source
+        dest = validation.sink
+        targets = np.insert(g.targets, g.offsets[dest], src)
+        offsets = g.offsets.copy()
+        offsets[dest+1:] += 1
+        edges = np.frombuffer(hierholzer_edges(offsets, targets, dest), dtype=np.int64)
+        path = targets[edges]
+        num_edges += 1
+    if len(edges) != num_edges:
+        # some edges are in a component the walk never reached
+        raise Exception("ERROR: Eulerian path does not exist!")
     return path
 
 def has_Eulerian_path(g):
-    exist = True
-    numSources = 0
-    numSinks = 0
-    for node in g.nodes:
-        out = len(node.outgoing)
-        _in = node.m_num_of_incoming
-        if out == _in:
-            continue
-        elif out == _in + 1:
-            numSources += 1
-            if numSources > 1:
-                exist = False
-                break
-        elif out + 1 == _in:
-            numSinks += 1
-            if numSinks > 1:
-                exist = False
-                break
-        else:
-            exist = False
-            break
-    return exist
+    # one source and one sink, or all nodes balanced (an Eulerian cycle)
+    return graph_validation(g).has_eulerian_path
 
 ##########################################################################################
 
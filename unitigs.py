@@ -0,0 +1,125 @@
+'''
+Unitig compaction of a de Bruijn graph.
+
+Most nodes of a de Bruijn graph built from real data have in-degree =
+out-degree = 1. compact_graph collapses every maximal non-branching path into
+one unitig carrying its spelled sequence, leaving a graph whose nodes are
+only the branching (k-1)-mers and whose edges are the unitigs. An Eulerian
+path over the unitigs spells the same genome as one over the original edges,
+but the traversal only has to visit the branching nodes.
+
+A component that is one cycle of non-branching nodes (e.g. a circular genome
+without repeats) has no branching node; one of its nodes is used as the
+anchor of a single circular unitig.
+'''
+
+from collections import defaultdict
+from typing import List
+
+from kmer_codec import spell_path
+
+class UnitigGraph:
+    def __init__(self, node_len: int):
+        # length of the (k-1)-mer node labels the unitigs overlap by
+        self.node_len = node_len
+        self.unitigs = []       # spelled sequence of every unitig
+        self.unitig_from = []   # first node of every unitig
+        self.unitig_to = []     # last node of every unitig
+        self.outgoing = defaultdict(list)   # node -> ids of unitigs leaving it
+
+    def __len__(self) -> int:
+        return len(self.unitigs)
+
+    def add_unitig(self, seq: str, u, v) -> int:
+        unitig_id = len(self.unitigs)
+        self.unitigs.append(seq)
+        self.unitig_from.append(u)
+        self.unitig_to.append(v)
+        self.outgoing[u].append(unitig_id)
+        return unitig_id
+
+def compact_graph(graph, k=None) -> UnitigGraph:
+    # graph is a DeBruijnGraph as built by debrujin_graph_from_kmers (not yet
+    # drained by eulPath); k is given when its nodes are packed codes
+    in_degree = graph.in_degree
+    out_degree = graph.out_degree
+    node_len = k - 1 if k is not None else len(next(iter(out_degree), ""))
+    ug = UnitigGraph(node_len)
+
+    def simple(node):
+        return in_degree.get(node, 0) == 1 and out_degree.get(node, 0) == 1
+
+    def walk_from(u, v):
+        # follow non-branching nodes from edge u -> v, returns the node path
+        walk = [u, v]
+        while simple(v) and v != u:
+            v = graph[v][0]
+            walk.append(v)
+        return walk
+
+    visited = set()
+    for u in out_degree:
+        if simple(u):
+            continue
+        for v in graph.get(u, ()):
+            walk = walk_from(u, v)
+            visited.update(walk[1:-1])
+            ug.add_unitig(spell_path(walk, k), u, walk[-1])
+    # what is left are cycles made only of non-branching nodes
+    for u in out_degree:
+        if simple(u) and u not in visited:
+            walk = walk_from(u, graph[u][0])
+            visited.update(walk)
+            ug.add_unitig(spell_path(walk, k), u, u)
+    return ug
+
+def unitig_eulerian_path(ug: UnitigGraph, stats=None) -> List[int]:
+    # Eulerian path over the unitigs (iterative Hierholzer with a cursor
+    # per node), as a list of unitig ids; empty if there is none. stats, if
+    # given, receives the number of dead ends the walk ran into
+    balance = defaultdict(int)
+    for u, v in zip(ug.unitig_from, ug.unitig_to):
+        balance[u] -= 1
+        balance[v] += 1
+    sources = [node for node, b in balance.items() if b == -1]
+    if len(ug) == 0 or len(sources) > 1:
+        return []
+    start = sources[0] if sources else ug.unitig_from[0]
+    outgoing = ug.outgoing
+    cursor = defaultdict(int)
+    nodes = [start]
+    edges = [-1]
+    path = []
+    dead_ends = 0
+    forward = False
+    while nodes:
+        u = nodes[-1]
+        out = outgoing.get(u, ())
+        c = cursor[u]
+        if c < len(out):
+            cursor[u] = c + 1
+            unitig_id = out[c]
+            nodes.append(ug.unitig_to[unitig_id])
+            edges.append(unitig_id)
+            forward = True
+        else:
+            if forward:
+                dead_ends += 1
+                forward = False
+            nodes.pop()
+            path.append(edges.pop())
+    if stats is not None:
+        stats["dead_ends"] = dead_ends
+    path.pop()
+    path.reverse()
+    if len(path) != len(ug):
+        return []
+    return path
+
+def spell_unitig_path(ug: UnitigGraph, path: List[int]) -> str:
+    # consecutive unitigs overlap by one node label
+    if not path:
+        return ""
+    n = ug.node_len
+    unitigs = ug.unitigs
+    return unitigs[path[0]] + "".join([unitigs[i][n:] for i in path[1:]])